@@ -0,0 +1,106 @@
+"""
+parse_any_date micro-benchmark: eski strptime döngüsü vs format öğrenen parser.
+
+    python bench/bench_dates.py
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import bot  # noqa: E402
+
+
+def parse_any_date_old(v):
+    # src/bot.py'deki önceki implementasyon (karşılaştırma için birebir kopya)
+    if not v:
+        return None
+    if isinstance(v, datetime):
+        return v
+    try:
+        if isinstance(v, (int, float)):
+            ts = float(v)
+            if ts > 1e12:
+                ts = ts / 1000.0
+            return datetime.fromtimestamp(ts)
+
+        if isinstance(v, str):
+            s = v.strip()
+            for fmt in (
+                "%Y-%m-%d %H:%M:%S.%f",
+                "%Y-%m-%d %H:%M:%S",
+                "%Y-%m-%dT%H:%M:%S.%f",
+                "%Y-%m-%dT%H:%M:%S",
+                "%d.%m.%Y %H:%M:%S",
+                "%d.%m.%Y",
+                "%d/%m/%Y %H:%M:%S",
+                "%d/%m/%Y",
+            ):
+                try:
+                    return datetime.strptime(s, fmt)
+                except Exception:
+                    continue
+            try:
+                return datetime.fromisoformat(s.replace("Z", "+00:00"))
+            except Exception:
+                return None
+    except Exception:
+        return None
+    return None
+
+
+# Betco (Local/UTC alanları, 7 haneli .NET kesirleri dahil) ve panel örnekleri
+SAMPLES = {
+    "bonus.date": [
+        "2025-12-22T04:41:34.054",
+        "2025-12-22T04:41:34",
+        "2025-12-22T04:41:34.1234567",
+        "2025-12-22T04:41:34Z",
+    ],
+    "member.history": [
+        "2025-07-11 08:05:19.859069",
+        "2025-07-11 08:05:19",
+    ],
+    "betco.lastDepositTime": [
+        "22.12.2025 04:41:34",
+        "22/12/2025",
+    ],
+    "epoch": [1734842494, 1734842494000],
+}
+
+
+def bench(fn, items, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for site, v in items:
+            fn(v, site)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    items = [(site, v) for site, vals in SAMPLES.items() for v in vals]
+
+    for site, v in items:
+        old, new = parse_any_date_old(v), bot.parse_any_date(v, site)
+        assert old == new, (v, old, new)
+
+    # epoch string'i öğrenmiş bir alanda YYYYMMDD yine tarih olarak okunmalı
+    assert bot.parse_any_date("1734842494", "compact") == datetime.fromtimestamp(1734842494)
+    for v in ("20250711", "1734842494", "20251222"):
+        expected = datetime.fromtimestamp(int(v)) if len(v) == 10 else parse_any_date_old(v)
+        assert bot.parse_any_date(v, "compact") == expected, v
+
+    rounds = int(os.getenv("BENCH_ROUNDS", "20000"))
+    n = rounds * len(items)
+    t_old = bench(lambda v, site: parse_any_date_old(v), items, rounds)
+    t_new = bench(bot.parse_any_date, items, rounds)
+    print(f"eski : {t_old / n * 1e6:7.2f} µs/çağrı")
+    print(f"yeni : {t_new / n * 1e6:7.2f} µs/çağrı")
+    print(f"hızlanma: x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
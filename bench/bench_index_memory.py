@@ -0,0 +1,116 @@
+"""
+USER_INDEX bellek ölçümü: ham panel dict'leri vs VipMember kayıtları; ayrıca panel
+bloğunun her sorguda hesaplanması ile kayıtta hazır tutulması arasındaki süre farkı.
+
+    python bench/bench_index_memory.py [üye sayısı]
+"""
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import bot  # noqa: E402
+
+LEVELS = [("iron", "Iron"), ("bronze", "Bronze"), ("silver", "Gümüş"), ("gold", "Altın"), ("plat", "Platin"), ("diamond", "Diamond")]
+
+
+def fake_page_json(start: int, n: int) -> str:
+    # /api/vip-members cevabına benzer sayfa; json.loads ile gerçek hayattaki gibi string'ler kopyalanır
+    rnd = random.Random(start)
+    items = []
+    for i in range(start, start + n):
+        lid, lname = rnd.choice(LEVELS)
+        items.append({
+            "id": i,
+            "username": f"user_{i}_{rnd.randint(0, 99999)}",
+            "level": {"id": lid, "name": lname},
+            "levelId": lid,
+            "levelName": lname,
+            "deposit90d": rnd.randint(0, 3_000_000),
+            "deposit30d": rnd.randint(0, 1_000_000),
+            "createdAt": "2024-03-11T10:22:31.000Z",
+            "updatedAt": "2025-12-22T04:41:34.054Z",
+            "rewards": {"bronze": "2025-01-02 10:00:00", "silver": None},
+            "note": "",
+        })
+    return json.dumps({"ok": True, "items": items})
+
+
+def legacy_panel_block(item: dict) -> str:
+    # VipMember öncesi format_panel_block (birebir kopya)
+    level = item.get("level") or {}
+    level_name = (level.get("name") if isinstance(level, dict) else None) or item.get("levelName") or "-"
+    level_id = None
+    if isinstance(level, dict):
+        level_id = level.get("id")
+    if not level_id:
+        level_id = item.get("levelId")
+    deposit90d_raw = item.get("deposit90d", 0)
+    deposit90d = bot.fmt_tl(deposit90d_raw)
+    _, remaining_raw = bot.next_level_remaining(str(level_id) if level_id else None, deposit90d_raw)
+    remaining = bot.fmt_tl(remaining_raw)
+    return (
+        f"VIP Statü Seviyesi: {level_name}\n"
+        f"Son 90 Günlük Yatırım: {deposit90d}\n"
+        f"Bir Sonraki Statü Kalan: {remaining}\n"
+    )
+
+
+def measure(n: int, compact: bool) -> int:
+    gc.collect()
+    tracemalloc.start()
+    index = {}
+    for start in range(0, n, 200):
+        for item in json.loads(fake_page_json(start, min(200, n - start)))["items"]:
+            index[item["username"]] = bot.compact_member(item) if compact else item
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del index
+    return size
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    edge = [
+        {"username": "a", "levelName": "Gold", "levelId": "gold", "deposit90d": 150000.7},
+        {"username": "b", "level": {"id": "plat"}, "deposit90d": None},
+        {"username": "c", "level": "x"},
+        {"username": "d", "level": {"id": "unknown", "name": "??"}, "deposit90d": "12"},
+        {"username": "e", "level": {"id": "diamond", "name": "Diamond"}, "deposit90d": 5_000_000},
+    ]
+    for item in edge + json.loads(fake_page_json(0, 500))["items"]:
+        assert legacy_panel_block(item) == bot.format_panel_block(bot.compact_member(item)), item
+
+    raw = measure(n, compact=False)
+    compact = measure(n, compact=True)
+    print(f"{n} üye")
+    print(f"ham dict : {raw / n:7.0f} B/üye  ({raw / 2**20:.1f} MiB)")
+    print(f"VipMember: {compact / n:7.0f} B/üye  ({compact / 2**20:.1f} MiB)")
+    print(f"azalma   : x{raw / compact:.1f}")
+
+    items = json.loads(fake_page_json(0, 2000))["items"]
+    members = [bot.compact_member(item) for item in items]
+    rounds = 50
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            legacy_panel_block(item)
+    legacy = (time.perf_counter() - t0) / (rounds * len(items))
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for m in members:
+            bot.format_panel_block(m)
+    cached = (time.perf_counter() - t0) / (rounds * len(members))
+    print(f"panel bloğu: her sorguda {legacy * 1e6:.2f}µs, kayıttan {cached * 1e6:.3f}µs")
+
+
+if __name__ == "__main__":
+    main()
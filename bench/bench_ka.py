@@ -0,0 +1,340 @@
+"""
+/ka uçtan uca gecikme benchmark'ı: panel ve Betco için yerel sahte HTTP sunucuları,
+sahte Telegram update'leri. Prod credential'ı ve internet gerekmez.
+
+    python bench/bench_ka.py --lookups 200 --concurrency 10 --panel-latency-ms 40 \\
+        --betco-latency-ms 120 --betco-error-rate 0.02 --betco-401
+
+Her tur (cold: boş cache, warm: aynı kullanıcılar tekrar) için p50/p95/p99,
+lookup başına istek sayısı ve throughput raporlanır. --prefetch ile cache süresi
+dolmuş tur, sıcak login prefetch'i olan ve olmayan haliyle karşılaştırılır.
+--cold-start ile indeks hazır olmadan (ilk tarama sürerken) gelen sorgular ölçülür.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+LEVELS = [("iron", "Iron"), ("bronze", "Bronze"), ("silver", "Gümüş"), ("gold", "Altın"), ("plat", "Platin"), ("diamond", "Diamond")]
+
+
+# ----------------------
+# Sahte sunucular
+# ----------------------
+class StandIn:
+    def __init__(self, name: str, latency_ms: float, error_rate: float, seed: int) -> None:
+        self.name = name
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: dict[str, int] = {}
+
+    def hit(self, key: str) -> bool:
+        """İsteği sayar, gecikmeyi uygular; hata dönülecekse True."""
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            fail = self.rnd.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        return fail
+
+    def total(self) -> int:
+        with self.lock:
+            return sum(self.counts.values())
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counts.clear()
+
+
+def make_handler(stand: StandIn, route):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def _send(self, status: int, body: dict | None) -> None:
+            data = json.dumps(body or {}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # yarışı kaybeden (iptal edilen) istekler
+                pass
+
+        def _handle(self, method: str) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            u = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(u.query).items()}
+            status, out = route(method, u.path, params, body, self.headers)
+            self._send(status, out)
+
+        def do_GET(self) -> None:
+            self._handle("GET")
+
+        def do_POST(self) -> None:
+            self._handle("POST")
+
+    return Handler
+
+
+def start_server(handler) -> tuple[ThreadingHTTPServer, str]:
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}"
+
+
+def panel_route(stand: StandIn, members: list[dict], page_size: int):
+    by_id = {m["id"]: m for m in members}
+
+    def route(method, path, params, body, headers):
+        if path == "/api/vip-members":
+            if stand.hit("vip-members"):
+                return 500, None
+            if "search" in params:
+                q = params["search"].lower()
+                return 200, {"ok": True, "totalPages": 1, "items": [m for m in members if q in m["username"].lower()][:20]}
+            page = int(params.get("page") or 1)
+            size = int(params.get("pageSize") or page_size)
+            total_pages = (len(members) + size - 1) // size
+            return 200, {"ok": True, "totalPages": total_pages, "items": members[(page - 1) * size: page * size]}
+        if path.startswith("/api/members/"):
+            if stand.hit("members/{id}"):
+                return 500, None
+            m = by_id.get(int(path.rsplit("/", 1)[-1]))
+            if not m:
+                return 404, {"ok": False}
+            return 200, {"ok": True, "member": {**m, "history": [
+                {"id": m["level"]["id"], "name": m["level"]["name"], "rewardAt": "2025-07-11 08:05:19.859069"},
+            ]}}
+        return 404, None
+
+    return route
+
+
+def betco_route(stand: StandIn, logins: dict[str, int], require_auth_token: bool, bonus_path: str):
+    def route(method, path, params, body, headers):
+        path = path.removeprefix("/api/en")
+        if require_auth_token and (not headers.get("authToken") or headers.get("Authentication")):
+            stand.hit(f"{path} 401")
+            return 401, None
+        key = f"{method} {path}"
+        if stand.hit(key):
+            return 503, None
+        if path == "/Client/GetClients":
+            cid = logins.get(body.get("Login"))
+            return 200, {"HasError": False, "Data": {"Objects": [{"Id": cid}] if cid else []}}
+        if path == "/Client/GetClientKpi":
+            return 200, {"HasError": False, "Data": {
+                "LastDepositAmount": 1500 + int(params.get("id", 0)) % 1000,
+                "LastDepositTimeLocal": "2025-12-22T04:41:34.054",
+            }}
+        if key == bonus_path:
+            return 200, {"HasError": False, "Data": {"Objects": [
+                {"Name": "Kayıp Bonusu", "Amount": 250, "ResultDateLocal": "2025-12-20T10:00:00"},
+                {"Name": "Yatırım Bonusu", "Amount": "1.000,50", "CreatedLocal": "2025-12-21T11:30:00.1234567"},
+            ]}}
+        return 404, None
+
+    return route
+
+
+# ----------------------
+# Sahte Telegram
+# ----------------------
+class FakeMessage:
+    def __init__(self, log: list) -> None:
+        self.log = log
+
+    async def reply_text(self, text: str, **kw):
+        self.log.append(("reply", time.perf_counter(), text))
+        return FakeMessage(self.log)
+
+    async def edit_text(self, text: str, **kw):
+        self.log.append(("edit", time.perf_counter(), text))
+        return self
+
+    async def reply_document(self, *a, **kw):
+        self.log.append(("document", time.perf_counter(), kw.get("filename")))
+        return FakeMessage(self.log)
+
+    async def delete(self):
+        return True
+
+
+def fake_update(chat_id: int, user_id: int, args: list[str]):
+    log: list = []
+    update = SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id, type="supergroup"),
+        effective_user=SimpleNamespace(id=user_id),
+        message=FakeMessage(log),
+    )
+    return update, SimpleNamespace(args=args), log
+
+
+# ----------------------
+# Çalıştırma
+# ----------------------
+def pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    v = sorted(values)
+    return v[min(len(v) - 1, int(round(p / 100 * (len(v) - 1))))]
+
+
+async def run_round(bot, usernames: list[str], concurrency: int, panel: StandIn, betco: StandIn) -> dict:
+    panel.reset()
+    betco.reset()
+    sem = asyncio.Semaphore(concurrency)
+    first: list[float] = []
+    final: list[float] = []
+
+    async def one(i: int, u: str) -> None:
+        async with sem:
+            update, ctx, log = fake_update(-1000 - (i % 3), i, [u])
+            t0 = time.perf_counter()
+            await bot.ka(update, ctx)
+            if log:
+                first.append(log[0][1] - t0)
+                final.append(log[-1][1] - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i, u) for i, u in enumerate(usernames)))
+    elapsed = time.perf_counter() - started
+    n = max(len(usernames), 1)
+    return {
+        "n": len(usernames),
+        "first": first,
+        "final": final,
+        "elapsed": elapsed,
+        "panel_per_lookup": panel.total() / n,
+        "betco_per_lookup": betco.total() / n,
+        "betco_counts": dict(betco.counts),
+    }
+
+
+def age_cache(bot, seconds: float) -> None:
+    """Saati ilerletmek yerine Betco cache bitişlerini geri çeker."""
+    for login, (expires, out, fetched_at) in list(bot.BETCO_CACHE.items()):
+        bot.BETCO_CACHE[login] = (expires - seconds, out, fetched_at - seconds)
+
+
+def report(title: str, r: dict) -> None:
+    ms = lambda x: f"{x * 1000:7.1f}ms"  # noqa: E731
+    print(f"\n== {title}: {r['n']} lookup, {r['elapsed']:.2f}s, {r['n'] / max(r['elapsed'], 1e-9):.1f} lookup/s")
+    print(f"  ilk cevap : p50 {ms(pct(r['first'], 50))}  p95 {ms(pct(r['first'], 95))}  p99 {ms(pct(r['first'], 99))}")
+    print(f"  son edit  : p50 {ms(pct(r['final'], 50))}  p95 {ms(pct(r['final'], 95))}  p99 {ms(pct(r['final'], 99))}")
+    print(f"  istek/lookup: panel {r['panel_per_lookup']:.2f}, betco {r['betco_per_lookup']:.2f}")
+    for k, v in sorted(r["betco_counts"].items()):
+        print(f"    {k:40s} {v}")
+
+
+async def main_async(args) -> None:
+    rnd = random.Random(args.seed)
+    members = []
+    for i in range(1, args.members + 1):
+        lid, lname = rnd.choice(LEVELS)
+        members.append({"id": i, "username": f"vip_{i}", "level": {"id": lid, "name": lname},
+                        "deposit90d": rnd.randint(0, 3_000_000)})
+    logins = {m["username"]: 100_000 + m["id"] for m in members}
+
+    panel = StandIn("panel", args.panel_latency_ms, args.panel_error_rate, args.seed)
+    betco = StandIn("betco", args.betco_latency_ms, args.betco_error_rate, args.seed + 1)
+    panel_srv, panel_url = start_server(make_handler(panel, panel_route(panel, members, args.page_size)))
+    betco_srv, betco_url = start_server(make_handler(
+        betco, betco_route(betco, logins, args.betco_401, args.bonus_endpoint)))
+
+    os.environ.update({
+        "BOT_TOKEN": "bench",
+        "DEBUG_BETCO": "0",
+        "ALLOWED_TELEGRAM_CHAT_IDS": "-1000,-1001,-1002",
+        "PANEL_API_BASE": panel_url,
+        "PANEL_PAGE_SIZE": str(args.page_size),
+        "BETCO_API_BASE": betco_url + "/api/en",
+        "BETCO_TIMEOUT": str(args.betco_timeout),
+        "BETCO_AUTHENTICATION": "bench-authentication",
+        "BETCO_AUTHTOKEN": "bench-token",
+        "INDEX_SNAPSHOT_PATH": "",
+        "CLIENT_ID_DB_PATH": "",
+        "PANEL_CONFIG_URL": "",
+    })
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+    import bot
+
+    usernames = [rnd.choice(members)["username"] for _ in range(args.lookups)]
+
+    if args.cold_start:
+        # açılışta snapshot yok: sorgular ilk taramayla aynı anda gelir
+        t0 = time.perf_counter()
+        r = await run_round(bot, list(dict.fromkeys(usernames))[:args.concurrency], args.concurrency, panel, betco)
+        print(f"ilk sorgular bitti: {time.perf_counter() - t0:.2f}s, o an indekste {len(bot.USER_INDEX)} üye")
+        report("cold start (indeks taranırken)", r)
+        while bot.INDEX_PARTIAL:
+            await asyncio.sleep(0.05)
+        bot.BETCO_CACHE.clear()
+    else:
+        t0 = time.perf_counter()
+        await bot.refresh_index(force=True, full=True)
+        print(f"indeks: {len(bot.USER_INDEX)} üye, {time.perf_counter() - t0:.2f}s, panel istek {panel.total()}")
+    cold_users = list(dict.fromkeys(usernames))
+
+    report("cold (boş Betco cache)", await run_round(bot, cold_users, args.concurrency, panel, betco))
+    report("warm (aynı kullanıcılar, cache dolu)", await run_round(bot, usernames, args.concurrency, panel, betco))
+
+    if args.prefetch:
+        age_cache(bot, bot.BETCO_CACHE_TTL + 1)
+        report("süresi dolmuş, prefetch yok", await run_round(bot, usernames, args.concurrency, panel, betco))
+
+        age_cache(bot, bot.BETCO_CACHE_TTL - bot.BETCO_PREFETCH_LEAD + 1)
+        t0 = time.perf_counter()
+        refreshed = 0
+        while (n := await bot.prefetch_hot_betco()):
+            refreshed += n
+        print(f"\nprefetch: {refreshed} login, {time.perf_counter() - t0:.2f}s")
+        report("bitişe yakın, prefetch sonrası", await run_round(bot, usernames, args.concurrency, panel, betco))
+
+    panel_srv.shutdown()
+    betco_srv.shutdown()
+    await bot.close_panel_client()
+    await bot.close_betco_client()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--members", type=int, default=2000)
+    ap.add_argument("--page-size", type=int, default=200)
+    ap.add_argument("--lookups", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--panel-latency-ms", type=float, default=30)
+    ap.add_argument("--panel-error-rate", type=float, default=0.0)
+    ap.add_argument("--betco-latency-ms", type=float, default=80)
+    ap.add_argument("--betco-error-rate", type=float, default=0.0)
+    ap.add_argument("--betco-timeout", type=float, default=5)
+    ap.add_argument("--betco-401", action="store_true",
+                    help="Betco sadece Authentication'sız authToken varyantını kabul etsin")
+    ap.add_argument("--bonus-endpoint", default="POST /Client/GetClientBonuses",
+                    help="kullanılabilir bonus verisi dönen tek aday")
+    ap.add_argument("--prefetch", action="store_true",
+                    help="cache süresi dolmuş turu prefetch'li ve prefetch'siz çalıştır")
+    ap.add_argument("--cold-start", action="store_true",
+                    help="indeksi önceden kurmadan, ilk tarama sırasında sorgula")
+    ap.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
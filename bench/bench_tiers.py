@@ -0,0 +1,108 @@
+"""
+/tiers analizinin süresi ve doğruluğu: sahte USER_INDEX üstünde kolon kurma,
+rapor ve cache'li tekrar; sonuçlar düz Python (sıralayıp sayan) hesapla karşılaştırılır.
+
+    python bench/bench_tiers.py [üye sayısı]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("INDEX_SNAPSHOT_PATH", "")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import bot  # noqa: E402
+
+LEVELS = [("iron", "Iron"), ("bronze", "Bronze"), ("silver", "Gümüş"), ("gold", "Altın"), ("plat", "Platin"), ("diamond", "Diamond")]
+
+
+def build_index(n: int) -> dict:
+    rnd = random.Random(1)
+    index = {}
+    for i in range(n):
+        lid, lname = rnd.choice(LEVELS)
+        u = f"user_{i}"
+        index[u] = bot.compact_member({"id": i, "username": u, "level": {"id": lid, "name": lname},
+                                       "deposit90d": rnd.randint(0, 3_000_000)})
+    # seviyesi bilinmeyen ve deposit'i eksik kayıtlar da olsun
+    index["odd_1"] = bot.compact_member({"id": -1, "username": "odd_1", "level": {"id": "vip9", "name": "?"}, "deposit90d": None})
+    index["odd_2"] = bot.compact_member({"id": -2, "username": "odd_2", "levelName": "-", "deposit90d": "1500"})
+    # negatif ve aralık dışı deposit komşu seviyenin bandına taşmamalı
+    index["odd_3"] = bot.compact_member({"id": -3, "username": "odd_3", "level": {"id": "gold", "name": "Altın"}, "deposit90d": -5000})
+    index["odd_4"] = bot.compact_member({"id": -4, "username": "odd_4", "level": {"id": "iron", "name": "Iron"}, "deposit90d": 1e13})
+    return index
+
+
+def naive_check(index: dict, near_tl: int) -> None:
+    members = list(index.values())
+    lim = bot.TIERS_DEPOSIT_MAX
+    deps = sorted(min(max(bot._deposit_float(m.deposit90d), -lim), lim) for m in members)
+    cols = bot._tier_columns_sync(members)
+    segs = list(cols["segs"].values())
+    for q in bot.TIERS_PERCENTILES:
+        k = bot._pct_index(len(deps), q)
+        assert bot._kth_smallest(cols["sorted"], segs, k) == deps[k], q
+
+    counts = Counter(m.level_id if m.level_id in bot.VIP_ORDER else None for m in members)
+    for code, lvl in enumerate(bot.VIP_ORDER):
+        a, b, _ = cols["segs"].get(code, (0, 0, 0))
+        assert b - a == counts[lvl], lvl
+        next_level, target = bot.VIP_NEXT_TARGET[lvl]
+        if next_level is None:
+            continue
+        near = [m for m in members if m.level_id == lvl and 0 < m.remaining <= near_tl]
+        lines = bot._tiers_report_sync(cols, near_tl).splitlines()
+        near_line = next(line for line in lines
+                         if line.startswith(f"{bot.VIP_TR_NAME[lvl]} →"))
+        assert f": {len(near)} üye" in near_line, (near_line, len(near))
+        top = sorted(near, key=lambda m: m.remaining)[:bot.TIERS_NEAR_LIMIT]
+        listed = lines[lines.index(near_line) + 1:lines.index(near_line) + 1 + len(top)]
+        assert {x.split(":")[0].strip() for x in listed} <= {m.username for m in near}, listed
+        assert len(listed) == len(top) and all(x.startswith("  ") for x in listed), listed
+
+
+async def main_async(n: int) -> None:
+    t0 = time.perf_counter()
+    bot.USER_INDEX = build_index(n)
+    bot._index_changed()
+    print(f"{len(bot.USER_INDEX)} üye indeks: {time.perf_counter() - t0:.1f}s")
+
+    naive_check(bot.USER_INDEX, bot.TIERS_NEAR_TL)
+
+    # hesap thread'de: loop bu sırada diğer update'lere cevap verebilmeli
+    stall = [0.0]
+
+    async def heartbeat() -> None:
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stall[0] = max(stall[0], time.perf_counter() - t - 0.005)
+
+    hb = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.02)
+    t0 = time.perf_counter()
+    text = await bot.tiers_report(bot.TIERS_NEAR_TL)
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    await bot.tiers_report(bot.TIERS_NEAR_TL)
+    cached = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    await bot.tiers_report(50_000)
+    other = time.perf_counter() - t0
+    hb.cancel()
+
+    print(text)
+    print(f"\nilk /tiers (kolon + rapor): {cold * 1000:.0f}ms · aynı sürüm tekrar: {cached * 1000:.2f}ms · "
+          f"başka eşik: {other * 1000:.0f}ms · loop'un en uzun bloklanması: {stall[0] * 1000:.0f}ms")
+
+
+def main() -> None:
+    asyncio.run(main_async(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Telegram update eşzamanlılığı yük testi: gerçek Application + handler'lar,
+sahte Telegram API (BaseRequest) ve bench_ka'daki panel/Betco sahte sunucuları.
+
+    python bench/bench_updates.py --updates 200 --limits 1,4,16,64 --betco-latency-ms 120
+
+Her limit için aynı /ka update'leri update_queue'ya basılır; hepsinin işlenme
+süresi, update/s ve update başına gecikme (kuyrukta bekleme dahil) raporlanır.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_ka import LEVELS, StandIn, betco_route, make_handler, panel_route, pct, start_server  # noqa: E402
+
+from telegram import Update  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+
+
+class FakeTelegram(BaseRequest):
+    """Bot API çağrılarını ağa çıkmadan cevaplar; sendMessage zamanlarını tutar."""
+
+    def __init__(self, latency_ms: float) -> None:
+        self.latency = latency_ms / 1000.0
+        self.message_id = 0
+        self.sent: dict[int, float] = {}  # reply_to update_id -> son mesaj zamanı
+
+    @property
+    def read_timeout(self) -> float | None:
+        return 5
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData | None = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            self.message_id += 1
+            chat_id = int(params.get("chat_id") or 0)
+            result = {"message_id": params.get("message_id") or self.message_id, "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "supergroup"}, "text": params.get("text", "")}
+            self.sent[chat_id] = time.perf_counter()
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def make_update(bot, update_id: int, chat_id: int, text: str) -> Update:
+    command = text.split()[0]
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup"},
+            "from": {"id": 1000 + update_id, "is_bot": False, "first_name": "staff"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }, bot)
+
+
+def reset_caches(bot) -> None:
+    bot.BETCO_CACHE.clear()
+    bot.BETCO_INFLIGHT.clear()
+    bot.CLIENT_IDS.clear()
+    bot.HOT_LOGINS.clear()
+
+
+async def run_limit(bot, limit: int, usernames: list[str], telegram_latency_ms: float) -> dict:
+    reset_caches(bot)
+    fake = FakeTelegram(telegram_latency_ms)
+    app = bot.build_application(concurrent_updates=limit, request=fake)
+    await app.initialize()
+    await app.start()
+
+    # her update kendi chat'inde: cevap zamanı chat_id'den okunur
+    chats = [-(10_000 + i) for i in range(len(usernames))]
+    started = time.perf_counter()
+    for i, (chat_id, u) in enumerate(zip(chats, usernames)):
+        app.update_queue.put_nowait(make_update(app.bot, i + 1, chat_id, f"/ka {u}"))
+    await app.update_queue.join()
+    elapsed = time.perf_counter() - started
+
+    await app.stop()
+    await app.shutdown()
+    latencies = [fake.sent[c] - started for c in chats if c in fake.sent]
+    return {"limit": limit, "n": len(usernames), "elapsed": elapsed, "latencies": latencies}
+
+
+async def main_async(args) -> None:
+    rnd = random.Random(args.seed)
+    members = []
+    for i in range(1, args.members + 1):
+        lid, lname = rnd.choice(LEVELS)
+        members.append({"id": i, "username": f"vip_{i}", "level": {"id": lid, "name": lname},
+                        "deposit90d": rnd.randint(0, 3_000_000)})
+    logins = {m["username"]: 100_000 + m["id"] for m in members}
+
+    panel = StandIn("panel", args.panel_latency_ms, 0.0, args.seed)
+    betco = StandIn("betco", args.betco_latency_ms, 0.0, args.seed + 1)
+    panel_srv, panel_url = start_server(make_handler(panel, panel_route(panel, members, 200)))
+    betco_srv, betco_url = start_server(make_handler(
+        betco, betco_route(betco, logins, False, "POST /Client/GetClientBonuses")))
+
+    chat_ids = ",".join(str(-(10_000 + i)) for i in range(args.updates))
+    os.environ.update({
+        "BOT_TOKEN": "1:bench",
+        "DEBUG_BETCO": "0",
+        "ALLOWED_TELEGRAM_CHAT_IDS": chat_ids,
+        "PANEL_API_BASE": panel_url,
+        "BETCO_API_BASE": betco_url + "/api/en",
+        "BETCO_AUTHENTICATION": "bench-authentication",
+        "BETCO_AUTHTOKEN": "bench-token",
+        "INDEX_SNAPSHOT_PATH": "",
+        "CLIENT_ID_DB_PATH": "",
+        "PANEL_CONFIG_URL": "",
+    })
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+    import bot
+
+    await bot.refresh_index(force=True, full=True)
+    usernames = [rnd.choice(members)["username"] for _ in range(args.updates)]
+
+    print(f"{args.updates} /ka update, Betco {args.betco_latency_ms:.0f}ms, panel {args.panel_latency_ms:.0f}ms, "
+          f"Telegram {args.telegram_latency_ms:.0f}ms")
+    print(f"{'limit':>6} {'süre':>8} {'update/s':>9} {'p50':>9} {'p95':>9}")
+    for limit in args.limits:
+        r = await run_limit(bot, limit, usernames, args.telegram_latency_ms)
+        ms = lambda x: f"{x * 1000:7.0f}ms"  # noqa: E731
+        print(f"{limit:>6} {r['elapsed']:>7.2f}s {r['n'] / max(r['elapsed'], 1e-9):>9.1f} "
+              f"{ms(pct(r['latencies'], 50))} {ms(pct(r['latencies'], 95))}")
+
+    panel_srv.shutdown()
+    betco_srv.shutdown()
+    await bot.close_panel_client()
+    await bot.close_betco_client()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--members", type=int, default=2000)
+    ap.add_argument("--updates", type=int, default=200)
+    ap.add_argument("--limits", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 16, 64])
+    ap.add_argument("--panel-latency-ms", type=float, default=30)
+    ap.add_argument("--betco-latency-ms", type=float, default=80)
+    ap.add_argument("--telegram-latency-ms", type=float, default=20)
+    ap.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,24 @@
 import os
+import sys
+import gc
 import time
 import json
+import hashlib
+import heapq
+import sqlite3
+import zlib
+import csv
+import io
+import re
+import random
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from itertools import compress
+from operator import attrgetter
+from typing import Callable
 import asyncio
-import requests
 import httpx
 import traceback
 from datetime import datetime
@@ -23,6 +39,8 @@ DEBUG_BETCO = (os.getenv("DEBUG_BETCO", "1").lower() in ("1", "true", "yes", "on
 BOT_TOKEN = (os.getenv("BOT_TOKEN") or os.getenv("TELEGRAM_BOT_TOKEN") or "").strip()
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN veya TELEGRAM_BOT_TOKEN .env içinde yok!")
+# Aynı anda işlenecek en fazla update; 1 = sırayla (bir /ka Betco'yu beklerken diğerleri kuyrukta kalır)
+TG_CONCURRENT_UPDATES = int(os.getenv("TG_CONCURRENT_UPDATES", "32"))
 
 # ======================
 # Panel ENV (Bearer)
@@ -31,7 +49,17 @@ PANEL_API_BASE = os.getenv("PANEL_API_BASE", "https://vipdashboard.netlify.app")
 PANEL_PAGE_SIZE = int(os.getenv("PANEL_PAGE_SIZE", "200"))
 PANEL_TIMEOUT = int(os.getenv("PANEL_TIMEOUT", "12"))
 PANEL_MAX_PAGES = int(os.getenv("PANEL_MAX_PAGES", "200"))
+PANEL_CONCURRENCY = int(os.getenv("PANEL_CONCURRENCY", "8"))
+PANEL_RETRIES = int(os.getenv("PANEL_RETRIES", "3"))
 INDEX_TTL_SECONDS = int(os.getenv("INDEX_TTL_SECONDS", "600"))
+# Delta refresh arada sırada tam rebuild ile mutabakat yapar
+INDEX_FULL_REBUILD_SECONDS = int(os.getenv("INDEX_FULL_REBUILD_SECONDS", "3600"))
+# Restart sonrası anında cevap için diskteki indeks snapshot'ı (boş = kapalı)
+INDEX_SNAPSHOT_PATH = (os.getenv("INDEX_SNAPSHOT_PATH", "index_snapshot.sqlite3") or "").strip()
+# İndekste olmayan username için /api/vip-members?<param>=username tekil sorgusu (boş = kapalı)
+PANEL_SEARCH_PARAM = (os.getenv("PANEL_SEARCH_PARAM", "search") or "").strip()
+# Panelde de bulunamayan username bu kadar süre tekrar sorulmaz
+PANEL_MISS_TTL = int(os.getenv("PANEL_MISS_TTL", "120"))
 
 # Panel API Bearer Token (senin yazdığın: Authorization: Bearer <BOT_API_TOKEN>)
 PANEL_BOT_API_TOKEN = (os.getenv("PANEL_BOT_API_TOKEN") or os.getenv("BOT_API_TOKEN") or "").strip()
@@ -51,6 +79,12 @@ ALLOWED_CHAT_IDS = {
 
 ALLOW_PRIVATE = (os.getenv("ALLOW_PRIVATE", "0").lower() in ("1", "true", "yes", "on"))
 
+# Admin komutları (/export vb.) için Telegram user id'leri
+ADMIN_USER_IDS = {
+    int(x) for x in os.getenv("ADMIN_TELEGRAM_USER_IDS", "").replace(" ", "").split(",")
+    if x.strip().isdigit()
+}
+
 def is_allowed(update: Update) -> bool:
     chat = update.effective_chat
     if chat is None:
@@ -67,6 +101,13 @@ def is_allowed(update: Update) -> bool:
     # Eğer hiç chat_id tanımlamazsan: güvenli olsun diye kapalı kalsın
     return False
 
+def is_admin(update: Update) -> bool:
+    user = update.effective_user
+    if user is None or not is_allowed(update):
+        return False
+    # admin tanımlı değilse admin komutları kapalı
+    return user.id in ADMIN_USER_IDS
+
 # ======================
 # Betco (BetConstruct webadmin) ENV (fallback)
 # ======================
@@ -85,6 +126,10 @@ APP_VERSION = os.getenv("BETCO_APP_VERSION", os.getenv("APP_VERSION", "")).strip
 PARTNER_ID = os.getenv("BETCO_PARTNER_ID", os.getenv("PARTNER_ID", "")).strip()
 VERIFY_SSL = os.getenv("BETCO_VERIFY_SSL", os.getenv("VERIFY_SSL", "false")).lower() in ("1", "true", "yes", "on")
 BETCO_TIMEOUT = float(os.getenv("BETCO_TIMEOUT", "25"))
+BETCO_HTTP2 = os.getenv("BETCO_HTTP2", "0").lower() in ("1", "true", "yes", "on")
+BETCO_MAX_CONNECTIONS = int(os.getenv("BETCO_MAX_CONNECTIONS", "20"))
+BETCO_KEEPALIVE_CONNECTIONS = int(os.getenv("BETCO_KEEPALIVE_CONNECTIONS", "10"))
+BETCO_KEEPALIVE_EXPIRY = float(os.getenv("BETCO_KEEPALIVE_EXPIRY", "60"))
 
 API_AUTHENTICATION = os.getenv("BETCO_AUTHENTICATION", os.getenv("API_AUTHENTICATION", "")).strip()
 API_AUTHTOKEN = os.getenv("BETCO_AUTHTOKEN", os.getenv("API_AUTHTOKEN", "")).strip()
@@ -101,6 +146,11 @@ VIP_TARGET_90D = {
     "plat": 500_000,
     "diamond": 2_000_000,
 }
+# seviye -> (sonraki seviye, hedef); en üst seviyede sonraki None. VIP_ORDER.index yerine O(1)
+VIP_NEXT_TARGET: dict[str, tuple[str | None, int]] = {
+    lvl: ((VIP_ORDER[i + 1], VIP_TARGET_90D.get(VIP_ORDER[i + 1], 0)) if i + 1 < len(VIP_ORDER) else (None, 0))
+    for i, lvl in enumerate(VIP_ORDER)
+}
 VIP_TR_NAME = {
     "iron": "Iron",
     "bronze": "Bronze",
@@ -110,13 +160,102 @@ VIP_TR_NAME = {
     "diamond": "Diamond",
 }
 
+# /tiers sıralama anahtarı: seviye kodu (VIP_ORDER sırası, bilinmeyen 255) * TIERS_SPAN + deposit90d.
+# deposit ±TIERS_DEPOSIT_MAX'a kırpılır (bantlar ayrık kalır); span 2'nin kuvveti, tam sayı
+# deposit'ler anahtarda birebir kalır.
+TIERS_SPAN = float(2 ** 40)
+TIERS_DEPOSIT_MAX = float(2 ** 39 - 1)
+TIER_UNKNOWN = 255
+_TIER_CODES = {lvl: i for i, lvl in enumerate(VIP_ORDER)}
+
+
+def _deposit_float(v) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _tier_key(level_id: str | None, deposit90d) -> float:
+    d = _deposit_float(deposit90d)
+    if d != d:  # NaN
+        d = 0.0
+    # aralık dışı deposit komşu seviyenin bandına taşmasın: sınıra kırpılır
+    d = min(max(d, -TIERS_DEPOSIT_MAX), TIERS_DEPOSIT_MAX)
+    return _TIER_CODES.get(level_id, TIER_UNKNOWN) * TIERS_SPAN + d
+
+
 # ======================
 # Panel in-memory index (stale-while-revalidate)
 # ======================
-USER_INDEX: dict[str, dict] = {}
+class VipMember:
+    """
+    USER_INDEX kaydı: ham panel JSON'u yerine sadece botun kullandığı alanlar.
+    level_id / level_name az sayıda farklı değer alır, intern edilir.
+    Sonraki seviye, kalan tutar, panel bloğundaki TL metinleri ve /tiers anahtarı kayıt
+    kurulurken bir kez hesaplanır; /ka'da sadece birleştirilir.
+    """
+    __slots__ = ("id", "username", "level_id", "level_name", "deposit90d", "next_level", "remaining",
+                 "deposit90d_tl", "remaining_tl", "tier_key")
+
+    def __init__(self, id, username: str, level_id: str | None, level_name, deposit90d) -> None:
+        self.id = id
+        self.username = username
+        self.level_id = level_id
+        self.level_name = level_name
+        self.deposit90d = deposit90d
+        self.next_level, self.remaining = next_level_remaining(level_id, deposit90d)
+        self.deposit90d_tl = fmt_tl(deposit90d)
+        # kalan tutar çoğu üyede aynı ("0 TL" vb.): tek kopya
+        self.remaining_tl = _REMAINING_TL.get(self.remaining) or _remaining_tl(self.remaining)
+        self.tier_key = _tier_key(level_id, deposit90d)
+
+    def astuple(self) -> tuple:
+        return (self.id, self.username, self.level_id, self.level_name, self.deposit90d)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, VipMember) and self.astuple() == other.astuple()
+
+    def __repr__(self) -> str:
+        return f"VipMember{self.astuple()!r}"
+
+
+def compact_member(item: dict) -> VipMember:
+    level = item.get("level") or {}
+    level_name = (level.get("name") if isinstance(level, dict) else None) or item.get("levelName") or "-"
+
+    level_id = None
+    if isinstance(level, dict):
+        level_id = level.get("id")
+    if not level_id:
+        level_id = item.get("levelId")
+    level_id = sys.intern(str(level_id)) if level_id else None
+    if isinstance(level_name, str):
+        level_name = sys.intern(level_name)
+
+    return VipMember(item.get("id"), item.get("username"), level_id, level_name, item.get("deposit90d", 0))
+
+
+USER_INDEX: dict[str, VipMember] = {}
 INDEX_EXPIRES_AT: float = 0.0
 INDEX_LOCK = asyncio.Lock()
 
+# Delta refresh için sayfa durumu: page -> (etag, içerik hash, sayfadaki username'ler)
+INDEX_PAGES: dict[int, tuple[str | None, str, tuple[str, ...]]] = {}
+INDEX_TOTAL_PAGES: int = 0
+INDEX_FULL_AT: float = 0.0
+# Son başarılı refresh (veya yüklenen snapshot) zamanı — indeks yaşı için
+INDEX_LAST_OK_AT: float = 0.0
+
+# USER_INDEX her değiştiğinde artar; indeks üstü hesaplar (/tiers) buna göre cache'lenir
+INDEX_VERSION: int = 0
+# İlk taramada (boş indeks) sayfalar geldikçe USER_INDEX'e yazılır; tarama bitene kadar True
+INDEX_PARTIAL: bool = False
+# Her yayınlanan sayfada (ve tarama sonunda) set edilip yenisiyle değiştirilir
+INDEX_GROWTH = asyncio.Event()
+# Kısmi indekste bulunamayan username için en fazla bu kadar beklenir
+INDEX_CRAWL_WAIT_SECONDS = float(os.getenv("INDEX_CRAWL_WAIT_SECONDS", "60"))
+
 REFRESH_IN_FLIGHT: bool = False
 REFRESH_LAST_START: float = 0.0
 MIN_REFRESH_GAP_SECONDS = 5.0
@@ -131,10 +270,574 @@ CFG_LOCK = asyncio.Lock()
 # ======================
 # Betco cache (hız) - login bazlı
 # ======================
-BETCO_CACHE: dict[str, tuple[float, dict]] = {}
-BETCO_CACHE_TTL = 120  # saniye
+# login -> (expires_at, sonuç, fetched_at); LRU sırası: en son kullanılan sonda
+BETCO_CACHE: "OrderedDict[str, tuple[float, dict, float]]" = OrderedDict()
+BETCO_CACHE_TTL = int(os.getenv("BETCO_CACHE_TTL", "120"))  # saniye
+# Süresi dolmuş OK sonuçlar bu kadar daha tutulur: hemen dönülür, arkaplanda tazelenir
+BETCO_CACHE_STALE_GRACE = int(os.getenv("BETCO_CACHE_STALE_GRACE", "1800"))
+BETCO_CACHE_NOT_FOUND_TTL = int(os.getenv("BETCO_CACHE_NOT_FOUND_TTL", "600"))
+BETCO_CACHE_ERROR_TTL = int(os.getenv("BETCO_CACHE_ERROR_TTL", "15"))
+BETCO_CACHE_MAX = int(os.getenv("BETCO_CACHE_MAX", "5000"))
+# login -> uçuştaki sorgu (aynı login'e eşzamanlı istekler tek zincirde birleşir)
+BETCO_INFLIGHT: dict[str, asyncio.Task] = {}
+# Sık sorgulanan login'lerin cache'i süresi dolmadan arkaplanda tazelenir
+BETCO_PREFETCH = os.getenv("BETCO_PREFETCH", "0").lower() in ("1", "true", "yes", "on")
+BETCO_PREFETCH_INTERVAL = int(os.getenv("BETCO_PREFETCH_INTERVAL", "15"))
+BETCO_PREFETCH_TOP = int(os.getenv("BETCO_PREFETCH_TOP", "100"))
+BETCO_PREFETCH_LEAD = int(os.getenv("BETCO_PREFETCH_LEAD", "30"))  # bitişe bu kadar kala tazele
+BETCO_PREFETCH_CONCURRENCY = int(os.getenv("BETCO_PREFETCH_CONCURRENCY", "2"))
+BETCO_PREFETCH_MAX_PER_RUN = int(os.getenv("BETCO_PREFETCH_MAX_PER_RUN", "20"))
+HOT_HALF_LIFE = float(os.getenv("HOT_HALF_LIFE", "3600"))  # sorgu sayacının yarılanma süresi
+HOT_MIN_SCORE = float(os.getenv("HOT_MIN_SCORE", "2"))
+HOT_MAX = 20000
+# login -> (azalan sorgu skoru, son güncelleme zamanı)
+HOT_LOGINS: dict[str, tuple[float, float]] = {}
+
+# ======================
+# Toplu sorgu (/kaa)
+# ======================
+BATCH_MAX_USERNAMES = int(os.getenv("BATCH_MAX_USERNAMES", "100"))
+# Tüm toplu sorgular arasında paylaşılan üst sınır (Betco + panel detay)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "6"))
+# Bu sayıdan fazla satır varsa mesaj yerine CSV dosyası gönderilir
+BATCH_DOCUMENT_THRESHOLD = int(os.getenv("BATCH_DOCUMENT_THRESHOLD", "30"))
+BATCH_SEM = asyncio.Semaphore(max(BATCH_CONCURRENCY, 1))
+TG_MESSAGE_LIMIT = 4000
+
+# ======================
+# Login -> Betco clientId (kalıcı, SQLite)
+# ======================
+CLIENT_ID_DB_PATH = (os.getenv("CLIENT_ID_DB_PATH", "client_ids.sqlite3") or "").strip()
+CLIENT_ID_NEGATIVE_TTL = int(os.getenv("CLIENT_ID_NEGATIVE_TTL", "3600"))
+# bulunan id de bu süreden sonra GetClients ile doğrulanır (yanlış eşleşme kalıcı olmasın)
+CLIENT_ID_POSITIVE_TTL = int(os.getenv("CLIENT_ID_POSITIVE_TTL", str(7 * 24 * 3600)))
+CLIENT_ID_PREFETCH = os.getenv("CLIENT_ID_PREFETCH", "0").lower() in ("1", "true", "yes", "on")
+CLIENT_ID_PREFETCH_INTERVAL = int(os.getenv("CLIENT_ID_PREFETCH_INTERVAL", "900"))
+CLIENT_ID_PREFETCH_BATCH = int(os.getenv("CLIENT_ID_PREFETCH_BATCH", "200"))
+CLIENT_ID_PREFETCH_CONCURRENCY = int(os.getenv("CLIENT_ID_PREFETCH_CONCURRENCY", "2"))
+# login -> (clientId veya None=bulunamadı, kayıt zamanı)
+CLIENT_IDS: dict[str, tuple[int | None, float]] = {}
+
+
+
+# ======================
+# Metrics (Prometheus text format + /stats)
+# ======================
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip()
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0") or 0)  # 0 = endpoint kapalı
+
+HIST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# (isim, label'lar) -> değer
+METRIC_COUNTERS: dict[tuple[str, tuple], float] = {}
+# (isim, label'lar) -> [bucket sayıları..., +Inf, toplam süre]
+METRIC_HISTS: dict[tuple[str, tuple], list[float]] = {}
+STARTED_AT = time.time()
+
+
+def metric_inc(name: str, value: float = 1, **labels) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    METRIC_COUNTERS[key] = METRIC_COUNTERS.get(key, 0) + value
+
+
+def metric_observe(name: str, seconds: float, **labels) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    h = METRIC_HISTS.get(key)
+    if h is None:
+        h = METRIC_HISTS[key] = [0.0] * (len(HIST_BUCKETS) + 2)
+    for i, b in enumerate(HIST_BUCKETS):
+        if seconds <= b:
+            h[i] += 1
+            break
+    else:
+        h[len(HIST_BUCKETS)] += 1
+    h[-1] += seconds
+
+
+class timed:
+    """
+    with timed("ka_stage_seconds", stage="betco"): ...  — süreyi histograma yazar.
+    """
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name: str, **labels) -> None:
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "timed":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        metric_observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+async def timed_coro(coro, name: str, **labels):
+    # eşzamanlı çalışan task'lar için: bekleme süresi değil işin kendi süresi ölçülür
+    with timed(name, **labels):
+        return await coro
+
+
+def hist_quantile(name: str, q: float, **labels) -> float | None:
+    """Bucket'lardan yaklaşık quantile (Prometheus histogram_quantile gibi)."""
+    h = METRIC_HISTS.get((name, tuple(sorted(labels.items()))))
+    if not h:
+        return None
+    total = sum(h[:-1])
+    if not total:
+        return None
+    rank = q * total
+    seen = 0.0
+    lower = 0.0
+    for i, b in enumerate(HIST_BUCKETS):
+        if seen + h[i] >= rank:
+            return lower + (b - lower) * ((rank - seen) / h[i] if h[i] else 0)
+        seen += h[i]
+        lower = b
+    return HIST_BUCKETS[-1]
+
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"')  # noqa: E731
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _gauges() -> dict[str, float]:
+    # scrape anında hesaplanan anlık değerler
+    return {
+        "user_index_size": len(USER_INDEX),
+        "user_index_age_seconds": (time.time() - INDEX_LAST_OK_AT) if INDEX_LAST_OK_AT else -1,
+        "betco_cache_size": len(BETCO_CACHE),
+        "betco_inflight": len(BETCO_INFLIGHT),
+        "betco_hot_logins": len(HOT_LOGINS),
+        "sched_queue_depth": SCHEDULER.queue_depth(),
+        "sched_queued_chats": len(SCHEDULER.queues),
+        "sched_running": SCHEDULER.running_total,
+        "client_id_map_size": len(CLIENT_IDS),
+        "uptime_seconds": time.time() - STARTED_AT,
+        # 0 = closed, 1 = half_open, 2 = open
+        "betco_breaker_state": _BREAKER_STATE_CODE[BETCO_BREAKER.state],
+        "panel_breaker_state": _BREAKER_STATE_CODE[PANEL_BREAKER.state],
+        "betco_rate_limit": BETCO_LIMITER.rate or 0,
+    }
+
+
+def render_prometheus() -> str:
+    lines: list[str] = []
+    for name, v in _gauges().items():
+        lines.append(f"# TYPE vipbot_{name} gauge")
+        lines.append(f"vipbot_{name} {v}")
+
+    counters = dict(METRIC_COUNTERS)
+    for outcome, v in AUTH_STATS.items():
+        counters[("betco_auth_variant_total", (("outcome", outcome),))] = v
+    typed: set[str] = set()
+    for (name, labels), v in sorted(counters.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE vipbot_{name} counter")
+        lines.append(f"vipbot_{name}{_fmt_labels(labels)} {v}")
+
+    typed.clear()
+    for (name, labels), h in sorted(METRIC_HISTS.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE vipbot_{name} histogram")
+        cum = 0.0
+        for i, b in enumerate(HIST_BUCKETS):
+            cum += h[i]
+            lines.append(f"vipbot_{name}_bucket{_fmt_labels(labels, (('le', b),))} {cum}")
+        cum += h[len(HIST_BUCKETS)]
+        lines.append(f"vipbot_{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {cum}")
+        lines.append(f"vipbot_{name}_sum{_fmt_labels(labels)} {h[-1]}")
+        lines.append(f"vipbot_{name}_count{_fmt_labels(labels)} {cum}")
+    return "\n".join(lines) + "\n"
+
+
+async def _metrics_conn(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b"/"
+        if path.split(b"?")[0] == b"/metrics":
+            body, status = render_prometheus().encode(), "200 OK"
+        else:
+            body, status = b"not found\n", "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server() -> asyncio.AbstractServer | None:
+    if not METRICS_PORT:
+        return None
+    srv = await asyncio.start_server(_metrics_conn, METRICS_HOST, METRICS_PORT)
+    print(f"[METRICS] http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return srv
+
+
+# ======================
+# Dayanıklılık: circuit breaker, adaptif rate limit, retry bütçesi
+# ======================
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BETCO_RATE_MAX = float(os.getenv("BETCO_RATE_MAX", "0"))  # istek/sn, 0 = sadece kısıtlanınca
+BETCO_RATE_MIN = float(os.getenv("BETCO_RATE_MIN", "1"))
+BETCO_RETRIES = int(os.getenv("BETCO_RETRIES", "1"))
+# her istek bütçeye bu kadar retry hakkı ekler (0.2 = isteklerin en fazla %20'si kadar retry)
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX = float(os.getenv("RETRY_BUDGET_MAX", "10"))
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.3"))
+
+
+class UpstreamUnavailable(RuntimeError):
+    """Circuit breaker açıkken istek hiç gönderilmez."""
+
+
+class CircuitBreaker:
+    """
+    Kayan pencerede hata/timeout oranı eşiği aşınca açılır, BREAKER_OPEN_SECONDS
+    boyunca hızlı hata verir, sonra tek deneme isteğiyle (half-open) kapanmayı dener.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.events: deque[tuple[float, bool]] = deque()
+        self.opened_at = 0.0
+        self.state = "closed"
+        self.probe_in_flight = False
+
+    def _trim(self, now: float) -> None:
+        while self.events and now - self.events[0][0] > BREAKER_WINDOW_SECONDS:
+            self.events.popleft()
+
+    def is_open(self) -> bool:
+        if self.state == "open" and time.time() - self.opened_at >= BREAKER_OPEN_SECONDS:
+            self.state = "half_open"
+            self.probe_in_flight = False
+        return self.state == "open" or (self.state == "half_open" and self.probe_in_flight)
+
+    def before_call(self) -> bool:
+        """
+        Returns: bu çağrı half-open deneme isteği mi (abandon'a geri verilir)
+        """
+        if self.is_open():
+            metric_inc("breaker_rejected_total", upstream=self.name)
+            raise UpstreamUnavailable(f"{self.name} circuit open")
+        if self.state == "half_open":
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def abandon(self, probe: bool, cancelled: bool) -> None:
+        """
+        Cevap alınamadan biten çağrı (iptal, timeout, beklenmeyen hata). Deneme isteğiyse
+        hata sayılır: yoksa probe_in_flight hiç temizlenmez, breaker half-open'da kilitlenir.
+        Kapalı durumda iptal (ör. kaybeden bonus adayı) upstream hatası sayılmaz.
+        """
+        if probe and self.state == "half_open":
+            self.record(False)
+        elif not cancelled:
+            self.record(False)
+
+    def record(self, ok: bool) -> None:
+        now = time.time()
+        if self.state == "half_open":
+            self.probe_in_flight = False
+            if ok:
+                self.state = "closed"
+                self.events.clear()
+                print(f"[BREAKER] {self.name} kapandı")
+            else:
+                self._open(now)
+            return
+        self.events.append((now, ok))
+        self._trim(now)
+        if self.state == "closed" and len(self.events) >= BREAKER_MIN_CALLS:
+            failures = sum(1 for _, o in self.events if not o)
+            if failures / len(self.events) >= BREAKER_FAILURE_RATIO:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self.events.clear()
+        metric_inc("breaker_opened_total", upstream=self.name)
+        print(f"[BREAKER] {self.name} açıldı, {BREAKER_OPEN_SECONDS:.0f}s hızlı hata")
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket; 429/5xx görünce hızı yarıya iner, başarıda yavaşça artar (AIMD).
+    rate_max 0 ise upstream kısıtlamadıkça limit yoktur; ilk kısıtlamada o anki
+    gözlenen hızın yarısından başlar, eski hıza ulaşınca limit tekrar kalkar.
+    """
+
+    def __init__(self, name: str, rate_max: float, rate_min: float) -> None:
+        self.name = name
+        self.rate_max = max(rate_max, 0.0)
+        self.rate_min = max(rate_min, 0.1)
+        self.rate: float | None = self.rate_max or None
+        self.ceiling = self.rate_max
+        self.tokens = self.rate or 0.0
+        self.updated = time.monotonic()
+        self.recent: deque[float] = deque()
+
+    def observed_rate(self) -> float:
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > 1.0:
+            self.recent.popleft()
+        return float(len(self.recent))
+
+    async def acquire(self) -> None:
+        while self.rate is not None:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                break
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+        self.recent.append(time.monotonic())
+        if len(self.recent) > 4096:
+            self.recent.popleft()
+
+    def on_throttle(self) -> None:
+        current = self.rate if self.rate is not None else max(self.observed_rate(), self.rate_min)
+        if not self.rate_max:
+            self.ceiling = max(self.ceiling, current)
+        self.rate = max(self.rate_min, current / 2)
+        self.tokens = min(self.tokens, self.rate)
+        self.updated = time.monotonic()
+
+    def on_success(self) -> None:
+        if self.rate is None:
+            return
+        self.rate += 0.1
+        if self.rate >= self.ceiling:
+            self.rate = self.rate_max or None
+            self.ceiling = self.rate_max
+
+
+class RetryBudget:
+    def __init__(self, ratio: float, cap: float) -> None:
+        self.ratio = ratio
+        self.cap = cap
+        self.balance = cap
+
+    def on_request(self) -> None:
+        self.balance = min(self.cap, self.balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.balance >= 1:
+            self.balance -= 1
+            return True
+        return False
+
+
+_BREAKER_STATE_CODE = {"closed": 0, "half_open": 1, "open": 2}
+BETCO_BREAKER = CircuitBreaker("betco")
+PANEL_BREAKER = CircuitBreaker("panel")
+BETCO_LIMITER = AdaptiveLimiter("betco", BETCO_RATE_MAX, BETCO_RATE_MIN)
+BETCO_RETRY_BUDGET = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+PANEL_RETRY_BUDGET = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+
+
+def _is_retryable_status(code: int) -> bool:
+    return code == 429 or code >= 500
+
+
+async def _backoff(attempt: int) -> None:
+    # full jitter: eşzamanlı istemciler aynı anda tekrar denemesin
+    await asyncio.sleep(random.uniform(0, RETRY_BACKOFF_BASE * (2 ** attempt)))
+
+
+# ======================
+# Adil zamanlayıcı: global + upstream başına limit, chat'ler arası round-robin
+# ======================
+SCHED_CONCURRENCY = int(os.getenv("SCHED_CONCURRENCY", "16"))
+SCHED_UPSTREAM_CONCURRENCY = {
+    "betco": int(os.getenv("SCHED_BETCO_CONCURRENCY", "8")),
+    "panel": int(os.getenv("SCHED_PANEL_CONCURRENCY", "12")),
+}
+# arkaplan işleri (stale tazeleme, prefetch) en fazla bu kadar slot tutar
+SCHED_BACKGROUND_CONCURRENCY = int(os.getenv("SCHED_BACKGROUND_CONCURRENCY", "2"))
 
 
+class FairScheduler:
+    """
+    İşler chat başına kuyruklarda bekler; boşalan her slot sıradaki chat'e verilir,
+    böylece kalabalık bir grup diğerlerini aç bırakmaz. Aynı anahtarlı (ör. aynı
+    login'in Betco sorgusu) kuyrukta/çalışan iş varsa yenisi eklenmez, sonucu paylaşılır.
+    chat_id None arkaplan kiracısıdır: işleri sadece hiçbir chat işi slot alamıyorken ve
+    en fazla background_cap kadar çalışır; bir chat aynı işi isterse chat kuyruğuna taşınır.
+    """
+
+    def __init__(self, total: int, caps: dict[str, int], background_cap: int = 1) -> None:
+        self.total = max(total, 1)
+        self.caps = {k: max(v, 1) for k, v in caps.items()}
+        self.background_cap = max(background_cap, 1)
+        self.running: dict[str, int] = {}
+        self.running_total = 0
+        self.background_running = 0
+        # chat_id -> bekleyen işler; sıra = round-robin sırası
+        self.queues: "OrderedDict[int, deque[tuple]]" = OrderedDict()
+        self.background: deque[tuple] = deque()
+        self.pending: dict[str, asyncio.Future] = {}
+        # anahtar -> sonucu hâlâ bekleyen çağıran sayısı
+        self.waiters: dict[str, int] = {}
+        # çalışan _exec task'ları: referansı tutulmayan task GC ile yarıda toplanabilir
+        self.tasks: set[asyncio.Task] = set()
+        self.started: set[asyncio.Future] = set()
+
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self.queues.values()) + len(self.background)
+
+    async def run(self, chat_id: int | None, upstream: str, key: str, factory: Callable,
+                  timeout: float | None = None):
+        """
+        timeout iş başladıktan sonra sayılır: kuyrukta bekleme süresi isteği zaman aşımına sokmaz.
+        chat_id None: düşük öncelikli arkaplan işi.
+        """
+        fut = self.pending.get(key)
+        if fut is not None:
+            metric_inc("sched_jobs_total", upstream=upstream, result="dedup")
+            if chat_id is not None:
+                self._promote(chat_id, fut)
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self.pending[key] = fut
+            job = (upstream, key, factory, fut, time.perf_counter(), timeout, chat_id is None)
+            if chat_id is None:
+                self.background.append(job)
+            else:
+                self.queues.setdefault(chat_id, deque()).append(job)
+            metric_inc("sched_jobs_total", upstream=upstream, result="queued")
+            self._dispatch()
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            # bekleyen birinin timeout'u paylaşılan işi iptal etmesin
+            return await asyncio.shield(fut)
+        finally:
+            n = self.waiters.pop(key, 1) - 1
+            if n > 0:
+                self.waiters[key] = n
+            elif not fut.done() and fut not in self.started:
+                # kimse beklemiyor ve iş henüz başlamadı: kuyrukta atlanır
+                fut.cancel()
+                if self.pending.get(key) is fut:
+                    self.pending.pop(key, None)
+                metric_inc("sched_jobs_total", upstream=upstream, result="abandoned")
+
+    def run_background(self, upstream: str, key: str, factory: Callable, timeout: float | None = None) -> asyncio.Task:
+        """
+        Sonucu beklenmeyen arkaplan işi; task referansı iş bitene kadar tutulur.
+        """
+        task = asyncio.create_task(self.run(None, upstream, key, factory, timeout))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    def _promote(self, chat_id: int, fut: asyncio.Future) -> None:
+        # kuyruktaki arkaplan işini bir kullanıcı bekliyor: artık chat işi
+        for job in self.background:
+            if job[3] is fut:
+                self.background.remove(job)
+                self.queues.setdefault(chat_id, deque()).append(job[:6] + (False,))
+                metric_inc("sched_jobs_total", upstream=job[0], result="promoted")
+                self._dispatch()
+                return
+
+    def _next_background(self) -> tuple | None:
+        if self.background_running >= self.background_cap:
+            return None
+        for job in [j for j in self.background if j[3].done()]:
+            self.background.remove(job)
+        for i, job in enumerate(self.background):
+            if self.running.get(job[0], 0) < self.caps.get(job[0], self.total):
+                del self.background[i]
+                return job
+        return None
+
+    def _next(self) -> tuple | None:
+        job = self._next_chat()
+        return job if job is not None else self._next_background()
+
+    def _next_chat(self) -> tuple | None:
+        for _ in range(len(self.queues)):
+            chat_id, q = next(iter(self.queues.items()))
+            self.queues.move_to_end(chat_id)
+            job = None
+            for i, j in enumerate(q):
+                if j[3].done():
+                    continue
+                if self.running.get(j[0], 0) < self.caps.get(j[0], self.total):
+                    job = j
+                    del q[i]
+                    break
+            # bekleyeni kalmamış (iptal edilmiş) işler kuyruktan düşer
+            for j in [j for j in q if j[3].done()]:
+                q.remove(j)
+            if not q:
+                del self.queues[chat_id]
+            if job is not None:
+                return job
+        return None
+
+    def _dispatch(self) -> None:
+        while self.running_total < self.total:
+            job = self._next()
+            if job is None:
+                return
+            upstream = job[0]
+            self.running[upstream] = self.running.get(upstream, 0) + 1
+            self.running_total += 1
+            if job[6]:
+                self.background_running += 1
+            self.started.add(job[3])
+            metric_observe("sched_wait_seconds", time.perf_counter() - job[4], upstream=upstream)
+            task = asyncio.create_task(self._exec(*job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _exec(self, upstream: str, key: str, factory: Callable, fut: asyncio.Future, queued_at: float,
+                    timeout: float | None, background: bool) -> None:
+        try:
+            result = await (asyncio.wait_for(factory(), timeout) if timeout is not None else factory())
+        except BaseException as e:
+            if not fut.done():
+                fut.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            if not fut.done():
+                fut.set_result(result)
+        finally:
+            self.running[upstream] -= 1
+            self.running_total -= 1
+            if background:
+                self.background_running -= 1
+            self.started.discard(fut)
+            if self.pending.get(key) is fut:
+                self.pending.pop(key, None)
+            self._dispatch()
+
+
+SCHEDULER = FairScheduler(SCHED_CONCURRENCY, SCHED_UPSTREAM_CONCURRENCY, SCHED_BACKGROUND_CONCURRENCY)
+
 
 # ----------------------
 # Panel HTTP helpers (Bearer)
@@ -146,55 +849,351 @@ def _panel_headers() -> dict[str, str]:
     return h
 
 
-def _get_json(url: str, params: dict | None = None, timeout: int = 12) -> dict:
-    last_err = None
+# ----------------------
+# Panel async HTTP (pooled)
+# ----------------------
+PANEL_HTTP: httpx.AsyncClient | None = None
+
+
+def _panel_client() -> httpx.AsyncClient:
+    global PANEL_HTTP
+    if PANEL_HTTP is None or PANEL_HTTP.is_closed:
+        PANEL_HTTP = httpx.AsyncClient(
+            timeout=httpx.Timeout(PANEL_TIMEOUT),
+            # requests gibi: http->https / sondaki "/" yönlendirmeleri izlensin
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=max(PANEL_CONCURRENCY, 1) * 2,
+                max_keepalive_connections=max(PANEL_CONCURRENCY, 1),
+            ),
+        )
+    return PANEL_HTTP
+
+
+async def close_panel_client() -> None:
+    global PANEL_HTTP
+    if PANEL_HTTP is not None and not PANEL_HTTP.is_closed:
+        await PANEL_HTTP.aclose()
+    PANEL_HTTP = None
+
+
+async def _panel_get(url: str, params: dict | None = None, etag: str | None = None,
+                     retries: int | None = None) -> httpx.Response:
     headers = _panel_headers()
-    for attempt in range(3):
+    if etag:
+        headers["If-None-Match"] = etag
+    client = _panel_client()
+    attempts = max(retries if retries is not None else PANEL_RETRIES, 1)
+    PANEL_RETRY_BUDGET.on_request()
+    attempt = 0
+    while True:
+        probe = PANEL_BREAKER.before_call()
         try:
-            r = requests.get(url, params=params, headers=headers, timeout=timeout)
-            r.raise_for_status()
-            return r.json()
-        except Exception as e:
-            last_err = e
-            time.sleep(0.6 * (attempt + 1))
-    raise last_err  # type: ignore
+            r = await client.get(url, params=params, headers=headers)
+        except httpx.TransportError:
+            PANEL_BREAKER.record(False)
+            if attempt + 1 >= attempts or not PANEL_RETRY_BUDGET.try_spend():
+                raise
+        except BaseException as e:
+            PANEL_BREAKER.abandon(probe, isinstance(e, asyncio.CancelledError))
+            raise
+        else:
+            PANEL_BREAKER.record(not _is_retryable_status(r.status_code))
+            if r.status_code == 304 or r.is_success:
+                return r
+            # 4xx (429 hariç) tekrar denense de değişmez
+            if not _is_retryable_status(r.status_code) or attempt + 1 >= attempts or not PANEL_RETRY_BUDGET.try_spend():
+                r.raise_for_status()
+        metric_inc("upstream_retry_total", upstream="panel")
+        await _backoff(attempt)
+        attempt += 1
+
+
+async def _get_json_async(url: str, params: dict | None = None, retries: int | None = None) -> dict:
+    r = await _panel_get(url, params=params, retries=retries)
+    return r.json()
+
+
+async def _fetch_index_page(page: int, etag: str | None = None,
+                            compare: bool = True) -> tuple[str | None, str, dict | None]:
+    """
+    Returns: (etag, içerik hash, data). compare=True iken 304 veya aynı hash ise data None döner.
+    """
+    url = f"{PANEL_API_BASE}/api/vip-members"
+    r = await _panel_get(url, params={"page": page, "pageSize": PANEL_PAGE_SIZE}, etag=etag)
+    new_etag = r.headers.get("ETag") or etag
+    if r.status_code == 304:
+        old = INDEX_PAGES.get(page)
+        return new_etag, (old[1] if old else ""), None
+    digest = hashlib.blake2b(r.content, digest_size=16).hexdigest()
+    old = INDEX_PAGES.get(page) if compare else None
+    if old and old[1] == digest:
+        return new_etag, digest, None
+    return new_etag, digest, r.json()
 
 
-def _build_full_index_sync() -> dict[str, dict]:
-    url = f"{PANEL_API_BASE}/api/vip-members"
-    index: dict[str, dict] = {}
+def _page_usernames(data: dict) -> tuple[str, ...]:
+    return tuple(u for u in ((item.get("username") for item in (data.get("items") or []))) if u)
+
+
+def _merge_page_items(index: dict[str, VipMember], data: dict) -> None:
+    for item in (data.get("items") or []):
+        u = item.get("username")
+        if u:
+            index[u] = compact_member(item)
+
+
+async def _fetch_pages(pages: list[int], etags: dict[int, str | None], compare: bool = True,
+                       on_page: Callable[[dict], None] | None = None) -> list[tuple[str | None, str, dict | None] | None]:
+    sem = asyncio.Semaphore(max(PANEL_CONCURRENCY, 1))
+
+    async def one(page: int):
+        async with sem:
+            try:
+                res = await _fetch_index_page(page, etags.get(page), compare)
+            except Exception as e:
+                if DEBUG_BETCO:
+                    print(f"[INDEX] page {page} failed:", repr(e))
+                return None
+            etag, digest, data = res
+            if data is not None and not data.get("ok"):
+                return None
+            if on_page is not None and data is not None:
+                on_page(data)
+            return res
+
+    return await asyncio.gather(*(one(p) for p in pages))
+
 
-    first = _get_json(url, params={"page": 1, "pageSize": PANEL_PAGE_SIZE}, timeout=PANEL_TIMEOUT)
+async def build_full_index(on_page: Callable[[dict], None] | None = None) -> tuple[dict[str, VipMember], list[int], dict[int, tuple[str | None, str, tuple[str, ...]]], int]:
+    """
+    Tüm /api/vip-members sayfalarını eşzamanlı çeker. on_page verilirse her sayfa
+    geldiği anda (sırasız) ona da verilir.
+    Returns: (index, başarısız sayfa numaraları, sayfa durumu, toplam sayfa)
+    """
+    index: dict[str, VipMember] = {}
+    pages_state: dict[int, tuple[str | None, str, tuple[str, ...]]] = {}
+    started = time.perf_counter()
+
+    url = f"{PANEL_API_BASE}/api/vip-members"
+    r1 = await _panel_get(url, params={"page": 1, "pageSize": PANEL_PAGE_SIZE})
+    first = r1.json()
     if not first.get("ok"):
-        return index
+        print("[INDEX] page 1 ok=false, indeks kurulamadı")
+        return index, [1], pages_state, 0
+    pages_state[1] = (r1.headers.get("ETag"), hashlib.blake2b(r1.content, digest_size=16).hexdigest(), _page_usernames(first))
+    if on_page is not None:
+        on_page(first)
 
     total_pages = int(first.get("totalPages") or 0)
     total_pages = min(total_pages, PANEL_MAX_PAGES)
 
-    for item in (first.get("items") or []):
-        u = item.get("username")
-        if u:
-            index[u] = item
+    pages = list(range(2, total_pages + 1))
+    # tam rebuild: etag/hash karşılaştırması yapılmaz, her sayfa gövdesiyle gelir
+    results = await _fetch_pages(pages, {}, compare=False, on_page=on_page)
+
+    # sayfa sırasıyla birleştir: sonuç sıralı çekimle birebir aynı olsun
+    _merge_page_items(index, first)
+    failed: list[int] = []
+    for page, res in zip(pages, results):
+        if res is None or res[2] is None:
+            failed.append(page)
+            continue
+        etag, digest, data = res
+        _merge_page_items(index, data)
+        pages_state[page] = (etag, digest, _page_usernames(data))
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"[INDEX] {len(index)} üye, {max(total_pages, 1)} sayfa, {elapsed:.2f}s"
+        + (f", başarısız sayfalar: {failed}" if failed else "")
+    )
+    return index, failed, pages_state, total_pages
+
+
+async def _delta_refresh_index() -> int | None:
+    """
+    Sayfaları koşullu istekle (If-None-Match) ve içerik hash'iyle kontrol eder,
+    sadece değişen sayfaların username'lerini USER_INDEX üzerinde yerinde yamalar.
+    Returns: değişen kayıt sayısı, delta mümkün değilse None (tam rebuild gerekir).
+    """
+    global INDEX_PAGES, INDEX_TOTAL_PAGES
+
+    if not INDEX_PAGES or not USER_INDEX:
+        return None
+    started = time.perf_counter()
 
-    for page in range(2, total_pages + 1):
-        data = _get_json(url, params={"page": page, "pageSize": PANEL_PAGE_SIZE}, timeout=PANEL_TIMEOUT)
-        if not data.get("ok"):
+    first_res = (await _fetch_pages([1], {1: (INDEX_PAGES.get(1) or (None,))[0]}))[0]
+    if first_res is None:
+        return None
+    if first_res[2] is None:
+        total_pages = INDEX_TOTAL_PAGES
+    else:
+        total_pages = min(int(first_res[2].get("totalPages") or 0), PANEL_MAX_PAGES)
+
+    pages = list(range(2, total_pages + 1))
+    etags = {p: st[0] for p, st in INDEX_PAGES.items()}
+    results = [first_res] + await _fetch_pages(pages, etags)
+
+    new_state = dict(INDEX_PAGES)
+    changed: list[tuple[int, dict]] = []
+    failed: list[int] = []
+    for page, res in zip([1] + pages, results):
+        if res is None:
+            failed.append(page)
+            continue
+        etag, digest, data = res
+        if data is None:
+            old = new_state.get(page)
+            if old:
+                new_state[page] = (etag, old[1], old[2])
             continue
+        new_state[page] = (etag, digest, _page_usernames(data))
+        changed.append((page, data))
+
+    # totalPages küçüldüyse artık olmayan sayfalar
+    dropped = [p for p in new_state if p > max(total_pages, 1)]
+    candidates: set[str] = set()
+    for p in dropped:
+        candidates.update(new_state.pop(p)[2])
+    for page, _ in changed:
+        old = INDEX_PAGES.get(page)
+        if old:
+            candidates.update(old[2])
+
+    removed: list[str] = []
+    if candidates:
+        live: set[str] = set()
+        for st in new_state.values():
+            live.update(st[2])
+        removed = [u for u in candidates if u not in live]
+
+    upserts = 0
+    for _, data in sorted(changed, key=lambda x: x[0]):
         for item in (data.get("items") or []):
             u = item.get("username")
             if u:
-                index[u] = item
+                m = compact_member(item)
+                if USER_INDEX.get(u) != m:
+                    upserts += 1
+                    if u not in USER_INDEX:
+                        _name_index_add(u)
+                USER_INDEX[u] = m
+    for u in removed:
+        USER_INDEX.pop(u, None)
+        _name_index_remove(u)
+    if upserts or removed:
+        _index_changed()
+
+    INDEX_PAGES = new_state
+    INDEX_TOTAL_PAGES = total_pages
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"[INDEX] delta: {len(changed)}/{max(total_pages, 1)} sayfa değişti, "
+        f"{upserts} güncel/yeni, {len(removed)} silindi, {elapsed:.2f}s"
+        + (f", başarısız sayfalar: {failed}" if failed else "")
+    )
+    return upserts + len(removed)
+
 
-    return index
+def _carry_over_failed_pages(new_index: dict[str, VipMember],
+                             pages_state: dict[int, tuple[str | None, str, tuple[str, ...]]],
+                             failed: list[int]) -> bool:
+    """
+    Tam rebuild'de alınamayan sayfaların üyeleri eski indeksten taşınır; sayfa durumu da
+    eskisi kalır, sonraki delta refresh o sayfaları yeniden kontrol eder.
+    Eski sayfa durumu yoksa False: yeni indeks eksik kalır, kullanılmamalı.
+    """
+    if any(p not in INDEX_PAGES for p in failed):
+        return False
+    for p in failed:
+        st = pages_state[p] = INDEX_PAGES[p]
+        for u in st[2]:
+            m = USER_INDEX.get(u)
+            if m is not None and u not in new_index:
+                new_index[u] = m
+    return True
 
 
 def _index_is_stale() -> bool:
     return not USER_INDEX or time.time() >= INDEX_EXPIRES_AT
 
 
-async def refresh_index(force: bool = False) -> bool:
+def _index_changed() -> None:
+    global INDEX_VERSION
+    INDEX_VERSION += 1
+
+
+def _notify_index_growth() -> None:
+    global INDEX_GROWTH
+    ev, INDEX_GROWTH = INDEX_GROWTH, asyncio.Event()
+    ev.set()
+
+
+def _begin_progressive_index() -> None:
+    global USER_INDEX, INDEX_PARTIAL, NAME_INDEX, FUZZY_KEYS, FUZZY_GRAMS
+    USER_INDEX = {}
+    NAME_INDEX, FUZZY_KEYS, FUZZY_GRAMS = {}, [], {}
+    INDEX_PARTIAL = True
+    _index_changed()
+
+
+def _publish_index_page(data: dict) -> None:
+    # sıra gelişe göre; tarama bitince sayfa sırasıyla kurulmuş indeks bunun yerine geçer
+    for item in (data.get("items") or []):
+        u = item.get("username")
+        if u:
+            if u not in USER_INDEX:
+                _name_index_add(u)
+            USER_INDEX[u] = compact_member(item)
+    _index_changed()
+    _notify_index_growth()
+
+
+def _end_progressive_index(ok: bool) -> None:
+    global USER_INDEX, INDEX_PARTIAL, NAME_INDEX, FUZZY_KEYS, FUZZY_GRAMS
+    if not INDEX_PARTIAL:
+        return
+    INDEX_PARTIAL = False
+    if not ok:
+        # yarım indeks "bulunamadı" cevabı üretmesin; sonraki sorgu yeniden kurar
+        USER_INDEX = {}
+        NAME_INDEX, FUZZY_KEYS, FUZZY_GRAMS = {}, [], {}
+        _index_changed()
+    _notify_index_growth()
+
+
+async def lookup_member_wait(username: str) -> tuple[str, VipMember] | None:
+    """
+    lookup_member; ilk tarama sürerken bulunamazsa username görünene ya da
+    tarama bitene kadar (en fazla INDEX_CRAWL_WAIT_SECONDS) bekler.
+    """
+    if not INDEX_PARTIAL:
+        return lookup_member(username)
+    deadline = time.monotonic() + INDEX_CRAWL_WAIT_SECONDS
+    norm = normalize_username(username)
+    while INDEX_PARTIAL and username not in USER_INDEX and norm not in NAME_INDEX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            await asyncio.wait_for(INDEX_GROWTH.wait(), remaining)
+        except asyncio.TimeoutError:
+            break
+    return lookup_member(username)
+
+
+async def refresh_index(force: bool = False, full: bool | None = None) -> bool:
+    """
+    full=None: sayfa durumu varsa ve son tam rebuild INDEX_FULL_REBUILD_SECONDS'tan
+    yeniyse delta refresh, aksi halde tam rebuild.
+    """
     global USER_INDEX, INDEX_EXPIRES_AT, REFRESH_IN_FLIGHT, REFRESH_LAST_START
+    global INDEX_PAGES, INDEX_TOTAL_PAGES, INDEX_FULL_AT, INDEX_LAST_OK_AT
 
+    # açılış snapshot'ı yüklenirken boş indeksle tam tarama başlatılmasın
+    await wait_index_snapshot()
     if not force and not _index_is_stale():
         return False
 
@@ -214,14 +1213,516 @@ async def refresh_index(force: bool = False) -> bool:
         REFRESH_IN_FLIGHT = True
         REFRESH_LAST_START = now
         try:
-            new_index = await asyncio.to_thread(_build_full_index_sync)
+            if full is None:
+                full = not INDEX_PAGES or (time.time() - INDEX_FULL_AT) >= INDEX_FULL_REBUILD_SECONDS
+            if not full:
+                try:
+                    with timed("index_refresh_seconds", mode="delta"):
+                        changed = await _delta_refresh_index()
+                except Exception:
+                    metric_inc("index_refresh_total", mode="delta", result="error")
+                    raise
+                if changed is not None:
+                    metric_inc("index_refresh_total", mode="delta", result="ok")
+                    metric_inc("index_delta_changes_total", changed)
+                    INDEX_EXPIRES_AT = time.time() + INDEX_TTL_SECONDS
+                    INDEX_LAST_OK_AT = time.time()
+                    if changed:
+                        await save_index_snapshot()
+                    return True
+
+            # indeks boşsa (ilk açılış, snapshot yok) sayfalar geldikçe yayınlanır
+            progressive = not USER_INDEX
+            if progressive:
+                _begin_progressive_index()
+            try:
+                with timed("index_refresh_seconds", mode="full"):
+                    new_index, failed, pages_state, total_pages = await build_full_index(
+                        _publish_index_page if progressive else None
+                    )
+            except Exception:
+                metric_inc("index_refresh_total", mode="full", result="error")
+                raise
+            metric_inc("index_failed_pages_total", len(failed))
+            if failed and not progressive and not _carry_over_failed_pages(new_index, pages_state, failed):
+                # eksik indeksle değiştirmek o sayfalardaki üyeleri "bulunamadı" yapar: eskisi kalır
+                print(f"[INDEX] başarısız sayfalar {failed} eski indekste yok, mevcut indeks korunuyor")
+                metric_inc("index_refresh_total", mode="full", result="partial")
+                return False
             if new_index:
+                metric_inc("index_refresh_total", mode="full", result="ok")
                 USER_INDEX = new_index
+                _index_changed()
+                INDEX_PAGES = pages_state
+                INDEX_TOTAL_PAGES = total_pages
+                # ilk taramada eksik kalan sayfalar için sonraki refresh yine tam rebuild olsun
+                INDEX_FULL_AT = 0.0 if failed and progressive else time.time()
                 INDEX_EXPIRES_AT = time.time() + INDEX_TTL_SECONDS
+                INDEX_LAST_OK_AT = time.time()
+                await rebuild_name_index()
+                _end_progressive_index(ok=True)
+                await save_index_snapshot()
                 return True
+            metric_inc("index_refresh_total", mode="full", result="empty")
             return False
         finally:
             REFRESH_IN_FLIGHT = False
+            if INDEX_PARTIAL:
+                _end_progressive_index(ok=False)
+
+
+# ----------------------
+# Username normalizasyon + fuzzy "bunu mu demek istediniz"
+# ----------------------
+# normalize(username) -> gerçek username
+NAME_INDEX: dict[str, str] = {}
+# trigram -> FUZZY_KEYS içindeki pozisyonlar (silinenler NAME_INDEX kontrolüyle elenir)
+FUZZY_KEYS: list[str] = []
+FUZZY_GRAMS: dict[str, array] = {}
+
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", "5"))
+SUGGEST_MAX_DISTANCE = int(os.getenv("SUGGEST_MAX_DISTANCE", "2"))
+# kısa sorguda (ör. k=2'de "alii_9") en nadir 3k+1 trigram neredeyse hepsi olur ve aday
+# kümesi indeksin yarısına çıkar; bu sınırı aşan eşik denenmez (öneri yok, gecikme sınırlı)
+SUGGEST_MAX_CANDIDATES = int(os.getenv("SUGGEST_MAX_CANDIDATES", "200000"))
+# ön elemeden geçenlerden en çok ortak trigramı olan bu kadarına edit distance bakılır
+SUGGEST_MAX_VERIFY = int(os.getenv("SUGGEST_MAX_VERIFY", "2000"))
+
+_TR_FOLD = str.maketrans({"İ": "i", "I": "i", "ı": "i"})
+
+
+def normalize_username(s: str) -> str:
+    # panel bazen username'i sayı olarak döndürüyor: str olmayan tek kayıt tüm rebuild'i düşürmesin
+    if not isinstance(s, str):
+        s = "" if s is None else str(s)
+    # Türkçe İ/ı/I hepsi "i": staff'ın klavyesinden bağımsız eşleşsin
+    return s.strip().lstrip("@").translate(_TR_FOLD).casefold()
+
+
+def _trigrams(key: str) -> set[str]:
+    k = f"  {key} "
+    return {k[i:i + 3] for i in range(len(k) - 2)}
+
+
+def _build_name_index_sync(usernames: list[str]) -> tuple[dict[str, str], list[str], dict[str, array]]:
+    names: dict[str, str] = {}
+    keys: list[str] = []
+    grams: dict[str, array] = {}
+    for u in usernames:
+        n = normalize_username(u)
+        if not n or n in names:
+            continue
+        names[n] = u
+        pos = len(keys)
+        keys.append(n)
+        for g in _trigrams(n):
+            arr = grams.get(g)
+            if arr is None:
+                arr = grams[g] = array("I")
+            arr.append(pos)
+    return names, keys, grams
+
+
+async def rebuild_name_index() -> None:
+    global NAME_INDEX, FUZZY_KEYS, FUZZY_GRAMS
+    started = time.perf_counter()
+    NAME_INDEX, FUZZY_KEYS, FUZZY_GRAMS = await asyncio.to_thread(_build_name_index_sync, list(USER_INDEX))
+    if DEBUG_BETCO:
+        print(f"[INDEX] isim indeksi: {len(NAME_INDEX)} anahtar, {time.perf_counter() - started:.2f}s")
+
+
+def _name_index_add(username: str) -> None:
+    n = normalize_username(username)
+    if not n or n in NAME_INDEX:
+        return
+    NAME_INDEX[n] = username
+    pos = len(FUZZY_KEYS)
+    FUZZY_KEYS.append(n)
+    for g in _trigrams(n):
+        arr = FUZZY_GRAMS.get(g)
+        if arr is None:
+            arr = FUZZY_GRAMS[g] = array("I")
+        arr.append(pos)
+
+
+def _name_index_remove(username: str) -> None:
+    n = normalize_username(username)
+    if NAME_INDEX.get(n) == username:
+        NAME_INDEX.pop(n, None)
+
+
+def lookup_member(username: str) -> tuple[str, VipMember] | None:
+    """
+    Önce birebir, sonra normalize edilmiş username ile arar.
+    Returns: (gerçek username, item) veya None
+    """
+    item = USER_INDEX.get(username)
+    if item:
+        metric_inc("user_index_lookup_total", result="exact")
+        return username, item
+    real = NAME_INDEX.get(normalize_username(username))
+    if real:
+        item = USER_INDEX.get(real)
+        if item:
+            metric_inc("user_index_lookup_total", result="normalized")
+            return real, item
+    metric_inc("user_index_lookup_total", result="miss")
+    return None
+
+
+def _edit_distance_within(a: str, b: str, k: int) -> int | None:
+    la, lb = len(a), len(b)
+    if abs(la - lb) > k:
+        return None
+    # sadece |i - j| <= k köşegen bandı hesaplanır (Ukkonen); bant dışı k+1 sayılır
+    over = k + 1
+    prev = [j if j <= k else over for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        ca = a[i - 1]
+        lo = i - k if i > k else 1
+        hi = i + k if i + k < lb else lb
+        cur = [over] * (lb + 1)
+        if i <= k:
+            cur[0] = i
+        row_min = cur[lo - 1]
+        for j in range(lo, hi + 1):
+            v = prev[j - 1] if ca == b[j - 1] else prev[j - 1] + 1
+            if prev[j] < v:
+                v = prev[j] + 1
+            if cur[j - 1] < v:
+                v = cur[j - 1] + 1
+            cur[j] = v
+            if v < row_min:
+                row_min = v
+        if row_min > k:
+            return None
+        prev = cur
+    return prev[lb] if prev[lb] <= k else None
+
+
+def _suggest_within(q: str, k: int, limit: int, names: dict[str, str], keys: list[str],
+                    index_grams: dict[str, array]) -> list[tuple[int, str]] | None:
+    """
+    Returns: (mesafe, anahtar) listesi; aday kümesi SUGGEST_MAX_CANDIDATES'i aşarsa None
+    """
+    grams = _trigrams(q)
+    # Bir düzenleme en fazla 3 trigram bozar: k düzenlemeli bir aday en nadir
+    # (3k+1) trigram listesinden en az birinde olmak zorunda (prefix filter)
+    postings = sorted((index_grams.get(g) or array("I") for g in grams), key=len)[:3 * k + 1]
+    if sum(map(len, postings)) > SUGGEST_MAX_CANDIDATES:
+        return None
+    cand: set[int] = set()
+    for arr in postings:
+        cand.update(arr)
+
+    need = len(grams) - 3 * k
+    shortlist: list[tuple[int, str]] = []
+    # silinip yeniden eklenen isim FUZZY_KEYS'te birden fazla pozisyonda olabilir
+    seen: set[str] = set()
+    for pos in cand:
+        key = keys[pos]
+        if key == q or abs(len(key) - len(q)) > k or key in seen:
+            continue
+        seen.add(key)
+        # ucuz ön eleme: ortak trigram sayısı (C'de substring araması)
+        padded = f"  {key} "
+        common = sum(1 for g in grams if g in padded)
+        if common < need or key not in names:
+            continue
+        shortlist.append((common, key))
+    if len(shortlist) > SUGGEST_MAX_VERIFY:
+        # ortak öneki paylaşan on binlerce isimde (ör. "mehmet...") edit distance asıl maliyet
+        shortlist = heapq.nlargest(SUGGEST_MAX_VERIFY, shortlist)
+
+    scored: list[tuple[int, str]] = []
+    for _, key in shortlist:
+        d = _edit_distance_within(q, key, k)
+        if d is not None:
+            scored.append((d, key))
+    scored.sort()
+    return scored[:limit]
+
+
+def suggest_usernames(query: str, limit: int | None = None, max_distance: int | None = None) -> list[str]:
+    """
+    Thread'de çağrılabilir: indeks referansları başta alınır, rebuild eskileri değiştirmez;
+    loop'taki ekleme/silmeler en kötü bir öneriyi eksik/fazla gösterir.
+    """
+    limit = SUGGEST_LIMIT if limit is None else limit
+    max_k = SUGGEST_MAX_DISTANCE if max_distance is None else max_distance
+    q = normalize_username(query)
+    names, keys, index_grams = NAME_INDEX, FUZZY_KEYS, FUZZY_GRAMS
+    if not q or not keys or limit <= 0:
+        return []
+
+    # önce tek karakter hatası (en sık durum, en dar aday kümesi); hiç yoksa eşik büyür
+    scored: list[tuple[int, str]] = []
+    for k in range(1, max_k + 1):
+        scored = _suggest_within(q, k, limit, names, keys, index_grams)
+        if scored is None:
+            # daha büyük k'nın aday kümesi daha da büyük
+            return []
+        if scored:
+            break
+    return [str(real) for real in (names.get(key) for _, key in scored) if real]
+
+
+# ----------------------
+# Index snapshot (SQLite, warm start)
+# ----------------------
+SNAPSHOT_VERSION = 3
+# üyeler/sayfalar parça parça saklanır: tek dev json.loads/dumps GIL'i yüzlerce ms tutup loop'u durduruyordu
+SNAPSHOT_CHUNK = 8192
+
+
+def _snapshot_chunk(rows: list) -> bytes:
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 1)
+
+
+def _write_snapshot_sync(path: str, index: dict[str, VipMember], pages: dict, total_pages: int, full_at: float) -> None:
+    members = [m.astuple() for m in index.values()]
+    page_rows = [[p, st[0], st[1], list(st[2])] for p, st in pages.items()]
+
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    con = sqlite3.connect(tmp)
+    try:
+        con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        con.execute("CREATE TABLE snapshot (id INTEGER PRIMARY KEY, kind TEXT, payload BLOB)")
+        con.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("version", str(SNAPSHOT_VERSION)),
+            ("savedAt", str(time.time())),
+            ("members", str(len(index))),
+            ("totalPages", str(total_pages)),
+            ("fullAt", str(full_at)),
+        ])
+        for kind, rows in (("members", members), ("pages", page_rows)):
+            for i in range(0, len(rows), SNAPSHOT_CHUNK):
+                con.execute("INSERT INTO snapshot (kind, payload) VALUES (?, ?)",
+                            (kind, _snapshot_chunk(rows[i:i + SNAPSHOT_CHUNK])))
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, path)
+
+
+async def save_index_snapshot() -> None:
+    if not INDEX_SNAPSHOT_PATH or not USER_INDEX:
+        return
+    # delta refresh USER_INDEX'i yerinde değiştirir; thread'e sabit bir kopya ver
+    index_copy = dict(USER_INDEX)
+    pages_copy = dict(INDEX_PAGES)
+    try:
+        await asyncio.to_thread(_write_snapshot_sync, INDEX_SNAPSHOT_PATH, index_copy, pages_copy,
+                                INDEX_TOTAL_PAGES, INDEX_FULL_AT)
+    except Exception as e:
+        print("[INDEX] snapshot yazılamadı:", repr(e))
+
+
+def _read_index_snapshot_sync() -> tuple[dict[str, VipMember], dict, dict[str, str]] | None:
+    """
+    Snapshot'ı okuyup VipMember'ları kurar (300k üyede saniyeler sürer: thread'de çağrılır).
+    Returns: (index, sayfalar, meta) veya None
+    """
+    if not INDEX_SNAPSHOT_PATH or not os.path.exists(INDEX_SNAPSHOT_PATH):
+        return None
+    index: dict[str, VipMember] = {}
+    pages: dict[int, tuple] = {}
+    try:
+        con = sqlite3.connect(f"file:{INDEX_SNAPSHOT_PATH}?mode=ro", uri=True)
+        try:
+            meta = dict(con.execute("SELECT key, value FROM meta").fetchall())
+            if meta.get("version") != str(SNAPSHOT_VERSION):
+                print("[INDEX] snapshot versiyonu uyumsuz, yok sayıldı:", meta.get("version"))
+                return None
+            for kind, payload in con.execute("SELECT kind, payload FROM snapshot ORDER BY id"):
+                rows = json.loads(zlib.decompress(payload).decode("utf-8"))
+                if kind == "pages":
+                    for p, etag, fetched_at, names in rows:
+                        pages[int(p)] = (etag, fetched_at, tuple(names))
+                    continue
+                for mid, u, level_id, level_name, deposit90d in rows:
+                    if u:
+                        index[u] = VipMember(
+                            mid, u,
+                            sys.intern(level_id) if isinstance(level_id, str) else level_id,
+                            sys.intern(level_name) if isinstance(level_name, str) else level_name,
+                            deposit90d,
+                        )
+        finally:
+            con.close()
+    except Exception as e:
+        print("[INDEX] snapshot okunamadı:", repr(e))
+        return None
+    if not index:
+        return None
+    return index, pages, meta
+
+
+def _apply_index_snapshot(index: dict[str, VipMember], pages: dict[int, tuple], meta: dict[str, str]) -> None:
+    """
+    Snapshot'ı USER_INDEX'e yükler. İndeks stale işaretlenir, böylece
+    eski veri hemen servis edilirken arka planda revalidation başlar.
+    """
+    global USER_INDEX, INDEX_PAGES, INDEX_TOTAL_PAGES, INDEX_FULL_AT, INDEX_EXPIRES_AT, INDEX_LAST_OK_AT
+
+    # yüklenirken panelden tekil sorguyla eklenenler snapshot'takinden taze
+    index.update(USER_INDEX)
+    USER_INDEX = index
+    _index_changed()
+    INDEX_PAGES = pages
+    INDEX_TOTAL_PAGES = int(meta.get("totalPages") or 0)
+    INDEX_FULL_AT = float(meta.get("fullAt") or 0.0)
+    INDEX_EXPIRES_AT = 0.0
+    INDEX_LAST_OK_AT = float(meta.get("savedAt") or 0)
+
+
+def load_index_snapshot() -> bool:
+    started = time.perf_counter()
+    loaded = _read_index_snapshot_sync()
+    if loaded is None:
+        return False
+    _apply_index_snapshot(*loaded)
+    age = time.time() - INDEX_LAST_OK_AT
+    print(f"[INDEX] snapshot yüklendi: {len(USER_INDEX)} üye, {age:.0f}s eski, "
+          f"{(time.perf_counter() - started) * 1000:.0f}ms")
+    return True
+
+
+# açılışta snapshot'ı thread'de yükleyen task; bitene kadar /ka panelden tekil sorguyla cevaplar
+SNAPSHOT_TASK: asyncio.Task | None = None
+
+
+def snapshot_loading() -> bool:
+    return SNAPSHOT_TASK is not None and not SNAPSHOT_TASK.done()
+
+
+async def load_index_snapshot_async() -> bool:
+    started = time.perf_counter()
+    # yüz binlerce nesne kurulurken gen2 toplamaları GIL'i tutup loop'u ~150ms durduruyor:
+    # yükleme boyunca GC duraklatılır, sonra yüklenenler freeze ile toplamaların dışına alınır
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        try:
+            loaded = await asyncio.to_thread(_read_index_snapshot_sync)
+        except Exception as e:
+            print("[INDEX] snapshot okunamadı:", repr(e))
+            return False
+        if loaded is None:
+            return False
+        async with INDEX_LOCK:
+            # yüklenirken tam tarama tamamlandıysa (ya da sürüyorsa) eski snapshot'a gerek yok
+            if INDEX_PAGES or INDEX_PARTIAL:
+                print("[INDEX] snapshot yüklendi ama indeks zaten kurulmuş, kullanılmadı")
+                return False
+            _apply_index_snapshot(*loaded)
+            await rebuild_name_index()
+        gc.freeze()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    age = time.time() - INDEX_LAST_OK_AT
+    print(f"[INDEX] snapshot yüklendi: {len(USER_INDEX)} üye, {age:.0f}s eski, "
+          f"{(time.perf_counter() - started) * 1000:.0f}ms (arkaplanda)")
+    return True
+
+
+async def wait_index_snapshot() -> None:
+    if snapshot_loading():
+        # bekleyenin iptali yüklemeyi iptal etmesin
+        await asyncio.wait({SNAPSHOT_TASK})
+
+
+async def ensure_index() -> bool:
+    """
+    İndeks boşsa taramayı başlatır (ya da süren taramaya bağlanır) ve ilk sayfa
+    yayınlanınca döner; tarama arkaplanda devam eder, eksikler lookup_member_wait ile beklenir.
+    """
+    await wait_index_snapshot()
+    if USER_INDEX:
+        return True
+    refresh = asyncio.create_task(refresh_index(force=True))
+    refresh.add_done_callback(_log_refresh_error)
+    while not USER_INDEX:
+        if refresh.done() and not INDEX_LOCK.locked():
+            break
+        grow = asyncio.create_task(INDEX_GROWTH.wait())
+        await asyncio.wait({grow} if refresh.done() else {grow, refresh}, return_when=asyncio.FIRST_COMPLETED)
+        grow.cancel()
+    return bool(USER_INDEX)
+
+
+# normalize(username) -> negatif kaydın bitişi
+PANEL_MISSES: "OrderedDict[str, float]" = OrderedDict()
+PANEL_MISSES_MAX = 10000
+# normalize(username) -> uçuştaki tekil sorgu
+PANEL_LOOKUP_INFLIGHT: dict[str, asyncio.Task] = {}
+
+
+async def _panel_search_member(username: str, norm: str) -> tuple[str, VipMember] | None:
+    url = f"{PANEL_API_BASE}/api/vip-members"
+    data = await _get_json_async(url, params={PANEL_SEARCH_PARAM: username, "page": 1, "pageSize": 20}, retries=1)
+    if not isinstance(data, dict) or not data.get("ok"):
+        return None
+    # panel parametreyi desteklemiyor ya da kısmi eşleşme dönüyorsa diye birebir kontrol
+    for item in (data.get("items") or []):
+        u = item.get("username")
+        if u and normalize_username(u) == norm:
+            m = compact_member(item)
+            if u not in USER_INDEX:
+                _name_index_add(u)
+            USER_INDEX[u] = m
+            _index_changed()
+            return u, m
+    return None
+
+
+async def panel_lookup_member(username: str) -> tuple[str, VipMember] | None:
+    """
+    İndeks miss'inde panelden sadece bu username'i sorar, bulursa indekse ekler.
+    Bulunamayanlar PANEL_MISS_TTL boyunca negatif cache'te; aynı anda gelen aynı sorgular birleşir.
+    """
+    norm = normalize_username(username)
+    if not PANEL_SEARCH_PARAM or not norm:
+        return None
+    now = time.time()
+    until = PANEL_MISSES.get(norm)
+    if until is not None:
+        if now < until:
+            metric_inc("panel_point_lookup_total", result="negative_cache")
+            return None
+        PANEL_MISSES.pop(norm, None)
+
+    task = PANEL_LOOKUP_INFLIGHT.get(norm)
+    if task is None:
+        task = asyncio.create_task(_panel_search_member(username, norm))
+        PANEL_LOOKUP_INFLIGHT[norm] = task
+        task.add_done_callback(lambda t, k=norm: PANEL_LOOKUP_INFLIGHT.pop(k, None))
+    try:
+        with timed("panel_point_lookup_seconds"):
+            found = await asyncio.shield(task)
+    except Exception as e:
+        # panel hatası negatif cache'e yazılmaz
+        metric_inc("panel_point_lookup_total", result="error")
+        if DEBUG_BETCO:
+            print(f"[INDEX] tekil sorgu {username}:", repr(e))
+        return None
+    if found is None:
+        PANEL_MISSES[norm] = time.time() + PANEL_MISS_TTL
+        PANEL_MISSES.move_to_end(norm)
+        while len(PANEL_MISSES) > PANEL_MISSES_MAX:
+            PANEL_MISSES.popitem(last=False)
+        metric_inc("panel_point_lookup_total", result="miss")
+        return None
+    metric_inc("panel_point_lookup_total", result="found")
+    return found
+
+
+def _log_refresh_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        print("[INDEX] refresh hatası:", repr(task.exception()))
 
 
 def maybe_trigger_refresh_in_background() -> None:
@@ -254,7 +1755,9 @@ def _apply_panel_config(cfg: dict) -> None:
     Response formatın farklıysa bile çoğu ismi yakalar.
     """
     global API_BASE, API_COOKIES, API_AUTHENTICATION, API_AUTHTOKEN, EXTRA_JSON, ORIGIN, REFERER, USER_AGENT, API_LANG, APP_VERSION, PARTNER_ID, VERIFY_SSL, BETCO_TIMEOUT
-    global EXTRA_HEADERS
+    global EXTRA_HEADERS, BETCO_CFG_VERSION
+
+    before = _betco_cfg_fingerprint()
 
     src = cfg
     # Sık görülen sarımlar
@@ -298,6 +1801,11 @@ def _apply_panel_config(cfg: dict) -> None:
     # newline temizliği
     EXTRA_HEADERS = {str(k): str(v).replace("\r", "").replace("\n", " ") for k, v in EXTRA_HEADERS.items()}
 
+    if _betco_cfg_fingerprint() != before:
+        # header'lar değişti: öğrenilmiş auth varyantları geçersiz
+        BETCO_CFG_VERSION += 1
+        AUTH_PREFERRED.clear()
+
 
 async def refresh_panel_config(force: bool = False) -> bool:
     global PANEL_CFG, CFG_EXPIRES_AT
@@ -311,14 +1819,18 @@ async def refresh_panel_config(force: bool = False) -> bool:
         if not force and not _cfg_is_stale():
             return False
         try:
-            cfg = await asyncio.to_thread(_get_json, PANEL_CONFIG_URL, None, PANEL_TIMEOUT)
+            with timed("config_refresh_seconds"):
+                cfg = await _get_json_async(PANEL_CONFIG_URL)
             if isinstance(cfg, dict) and (cfg.get("ok") is True or cfg.get("success") is True or cfg):
                 PANEL_CFG = cfg
                 CFG_EXPIRES_AT = time.time() + CONFIG_TTL_SECONDS
                 _apply_panel_config(cfg)
+                metric_inc("config_refresh_total", result="ok")
                 return True
+            metric_inc("config_refresh_total", result="empty")
             return False
         except Exception as e:
+            metric_inc("config_refresh_total", result="error")
             if DEBUG_BETCO:
                 print("[PANEL CFG] refresh failed:", repr(e))
             return False
@@ -338,57 +1850,147 @@ def maybe_refresh_config_background() -> None:
 # ----------------------
 # Member detail (rewards/history)
 # ----------------------
-def parse_any_date(v) -> datetime | None:
+_ISO_DT_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})(?:[ T](\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?)?")
+_DMY_DT_RE = re.compile(r"(\d{1,2})([./])(\d{1,2})\2(\d{4})(?: (\d{1,2}):(\d{1,2}):(\d{1,2}))?")
+
+
+def _parse_epoch(ts: float) -> datetime:
+    if ts > 1e12:
+        ts = ts / 1000.0
+    return datetime.fromtimestamp(ts)
+
+
+def _parse_iso_fast(s: str) -> datetime | None:
+    # "2025-07-11 08:05:19.859069", "2025-12-22T04:41:34.054", "2025-07-11"
+    m = _ISO_DT_RE.fullmatch(s)
+    if not m:
+        return None
+    y, mo, d, hh, mm, ss, frac = m.groups()
+    try:
+        if hh is None:
+            return datetime(int(y), int(mo), int(d))
+        us = int(frac[:6].ljust(6, "0")) if frac else 0
+        return datetime(int(y), int(mo), int(d), int(hh), int(mm), int(ss), us)
+    except ValueError:
+        return None
+
+
+def _parse_dmy(s: str) -> datetime | None:
+    # "11.07.2025 08:05:19", "11/07/2025"
+    m = _DMY_DT_RE.fullmatch(s)
+    if not m:
+        return None
+    d, _, mo, y, hh, mm, ss = m.groups()
+    try:
+        if hh is None:
+            return datetime(int(y), int(mo), int(d))
+        return datetime(int(y), int(mo), int(d), int(hh), int(mm), int(ss))
+    except ValueError:
+        return None
+
+
+def _parse_isoformat(s: str) -> datetime | None:
+    # timezone'lu / eksik saniyeli ISO varyantları
+    try:
+        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _parse_epoch_str(s: str) -> datetime | None:
+    # "20250711" (YYYYMMDD) epoch değil tarihtir: öğrenilmiş epoch parser'ı onu yutmasın
+    if len(s) == 8 and s.isdigit():
+        return None
+    try:
+        return _parse_epoch(float(s))
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def _date_parsers_for(s: str) -> tuple:
+    # string şeklinden formatı tahmin et: exception fırlatan deneme döngüsü yok
+    if len(s) >= 10 and s[4] == "-":
+        return (_parse_iso_fast, _parse_isoformat)
+    if len(s) >= 8 and ("." in s[1:3] or "/" in s[1:3]):
+        return (_parse_dmy,)
+    if s.isdigit() and len(s) in (10, 13):
+        return (_parse_epoch_str,)
+    if s.isdigit() and len(s) == 8:
+        return (_parse_isoformat,)
+    return ()
+
+
+# site (çağrı yeri + alan) -> en son çalışan parser
+_DATE_PARSER_BY_SITE: dict[str, Callable[[str], datetime | None]] = {}
+
+
+def _parse_date_legacy(s: str) -> datetime | None:
+    for fmt in (
+        "%Y-%m-%d %H:%M:%S.%f",
+        "%Y-%m-%d %H:%M:%S",
+        "%Y-%m-%dT%H:%M:%S.%f",
+        "%Y-%m-%dT%H:%M:%S",
+        "%d.%m.%Y %H:%M:%S",
+        "%d.%m.%Y",
+        "%d/%m/%Y %H:%M:%S",
+        "%d/%m/%Y",
+    ):
+        try:
+            return datetime.strptime(s, fmt)
+        except Exception:
+            continue
+    # ISO fallback
+    try:
+        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except Exception:
+        return None
+
+
+def parse_any_date(v, site: str | None = None) -> datetime | None:
+    """
+    site verilirse o çağrı yerinde en son çalışan format önce denenir.
+    Şekle uymayan string'ler eski strptime döngüsüne düşer.
+    """
     if not v:
         return None
     if isinstance(v, datetime):
         return v
     try:
         if isinstance(v, (int, float)):
-            ts = float(v)
-            if ts > 1e12:
-                ts = ts / 1000.0
-            return datetime.fromtimestamp(ts)
+            return _parse_epoch(float(v))
 
         if isinstance(v, str):
             s = v.strip()
-            # "2025-07-11 08:05:19.859069" veya "2025-12-22T04:41:34.054"
-            for fmt in (
-                "%Y-%m-%d %H:%M:%S.%f",
-                "%Y-%m-%d %H:%M:%S",
-                "%Y-%m-%dT%H:%M:%S.%f",
-                "%Y-%m-%dT%H:%M:%S",
-                "%d.%m.%Y %H:%M:%S",
-                "%d.%m.%Y",
-                "%d/%m/%Y %H:%M:%S",
-                "%d/%m/%Y",
-            ):
-                try:
-                    return datetime.strptime(s, fmt)
-                except Exception:
-                    continue
-            # ISO fallback
-            try:
-                return datetime.fromisoformat(s.replace("Z", "+00:00"))
-            except Exception:
-                return None
+            if site is not None:
+                learned = _DATE_PARSER_BY_SITE.get(site)
+                if learned is not None:
+                    d = learned(s)
+                    if d:
+                        return d
+            for parser in _date_parsers_for(s):
+                d = parser(s)
+                if d:
+                    if site is not None:
+                        _DATE_PARSER_BY_SITE[site] = parser
+                    return d
+            return _parse_date_legacy(s)
     except Exception:
         return None
     return None
 
 
-def fmt_ddmmyyyy(v) -> str:
-    d = parse_any_date(v)
+def fmt_ddmmyyyy(v, site: str | None = None) -> str:
+    d = parse_any_date(v, site)
     return d.strftime("%d/%m/%Y") if d else "-"
 
 
 def fmt_deposit_date(v) -> str:
-    return fmt_ddmmyyyy(v)
+    return fmt_ddmmyyyy(v, "betco.lastDepositTime")
 
 
-def _get_member_detail_sync(member_id: int) -> dict | None:
+async def get_member_detail(member_id: int) -> dict | None:
     url = f"{PANEL_API_BASE}/api/members/{member_id}"
-    j = _get_json(url, params=None, timeout=PANEL_TIMEOUT)
+    j = await _get_json_async(url)
     if isinstance(j, dict) and j.get("ok") is True and isinstance(j.get("member"), dict):
         return j["member"]
     return None
@@ -409,7 +2011,7 @@ def _latest_level_reward_from_member(member: dict | None) -> tuple[str, str]:
         for h in hist:
             if not isinstance(h, dict):
                 continue
-            dt = parse_any_date(h.get("rewardAt") or h.get("reward_at") or h.get("rewardDate"))
+            dt = parse_any_date(h.get("rewardAt") or h.get("reward_at") or h.get("rewardDate"), "member.history")
             if dt:
                 scored.append((dt, h))
         if scored:
@@ -419,14 +2021,14 @@ def _latest_level_reward_from_member(member: dict | None) -> tuple[str, str]:
     if best:
         name = best.get("name") or VIP_TR_NAME.get(str(best.get("id")), "-") or "-"
         dt = best.get("rewardAt") or "-"
-        return (str(name), fmt_ddmmyyyy(dt))
+        return (str(name), fmt_ddmmyyyy(dt, "member.history"))
 
     # history yoksa rewards dict
     rewards = member.get("rewards") or {}
     if isinstance(rewards, dict):
         scored = []
         for lvl, dt_raw in rewards.items():
-            dt = parse_any_date(dt_raw)
+            dt = parse_any_date(dt_raw, "member.rewards")
             if dt:
                 scored.append((dt, lvl))
         if scored:
@@ -462,40 +2064,45 @@ def fmt_amount(x: int | float | None) -> str:
 def next_level_remaining(level_id: str | None, deposit90d: int | float | None) -> tuple[str, int]:
     if not level_id or deposit90d is None:
         return ("-", 0)
-    if level_id not in VIP_ORDER:
+    nt = VIP_NEXT_TARGET.get(level_id)
+    if nt is None:
         return ("-", 0)
 
-    idx = VIP_ORDER.index(level_id)
-    if idx >= len(VIP_ORDER) - 1:
+    next_level, target = nt
+    if next_level is None:
         return ("En üst seviye", 0)
 
-    next_level = VIP_ORDER[idx + 1]
-    target = VIP_TARGET_90D.get(next_level, 0)
-    remaining = max(0, int(target - float(deposit90d)))
+    try:
+        remaining = max(0, int(target - float(deposit90d)))
+    except (TypeError, ValueError, OverflowError):
+        # kayıt kurulurken çağrılır: tek bozuk deposit tüm refresh'i düşürmesin
+        return ("-", 0)
     return (next_level, remaining)
 
 
-def format_panel_block(item: dict) -> str:
-    level = item.get("level") or {}
-    level_name = (level.get("name") if isinstance(level, dict) else None) or item.get("levelName") or "-"
+def panel_fields(item: VipMember) -> tuple[str, str | None, int | float | None, str, int]:
+    """
+    Returns: (seviye adı, seviye id, deposit90d, sonraki seviye, kalan)
+    """
+    return (item.level_name, item.level_id, item.deposit90d, item.next_level, item.remaining)
 
-    level_id = None
-    if isinstance(level, dict):
-        level_id = level.get("id")
-    if not level_id:
-        level_id = item.get("levelId")
 
-    deposit90d_raw = item.get("deposit90d", 0)
-    deposit90d = fmt_tl(deposit90d_raw)
+_REMAINING_TL: dict[int, str] = {}
+
 
-    _, remaining_raw = next_level_remaining(str(level_id) if level_id else None, deposit90d_raw)
-    remaining = fmt_tl(remaining_raw)
+def _remaining_tl(remaining: int) -> str:
+    s = fmt_tl(remaining)
+    if len(_REMAINING_TL) < 10000:
+        _REMAINING_TL[remaining] = s
+    return s
 
+
+def format_panel_block(item: VipMember) -> str:
     # Parantez içi (PLAT) vs KALDIRILDI
     return (
-        f"VIP Statü Seviyesi: {level_name}\n"
-        f"Son 90 Günlük Yatırım: {deposit90d}\n"
-        f"Bir Sonraki Statü Kalan: {remaining}\n"
+        f"VIP Statü Seviyesi: {item.level_name}\n"
+        f"Son 90 Günlük Yatırım: {item.deposit90d_tl}\n"
+        f"Bir Sonraki Statü Kalan: {item.remaining_tl}\n"
     )
 
 
@@ -586,58 +2193,222 @@ def _auth_variants(base: dict[str, str]) -> list[dict[str, str]]:
     return uniq
 
 
-async def betco_post_json(path: str, payload: dict) -> dict:
+# ----------------------
+# Betco shared HTTP client (keep-alive, opsiyonel HTTP/2)
+# ----------------------
+BETCO_HTTP: httpx.AsyncClient | None = None
+BETCO_HTTP_KEY: tuple | None = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+async def _close_client_later(client: httpx.AsyncClient, delay: float) -> None:
+    # uçuştaki istekler bitsin diye eski client hemen kapatılmaz
+    await asyncio.sleep(delay)
+    try:
+        await client.aclose()
+    except Exception:
+        pass
+
+
+def _betco_client() -> httpx.AsyncClient:
+    """
+    App genelinde tek client. Sadece VERIFY_SSL / BETCO_TIMEOUT / API_BASE
+    değişince (panel config) yeniden kurulur.
+    """
+    global BETCO_HTTP, BETCO_HTTP_KEY
+
+    key = (VERIFY_SSL, BETCO_TIMEOUT, API_BASE)
+    if BETCO_HTTP is not None and not BETCO_HTTP.is_closed and BETCO_HTTP_KEY == key:
+        return BETCO_HTTP
+
+    old = BETCO_HTTP
+    http2 = BETCO_HTTP2 and _http2_available()
+    if BETCO_HTTP2 and not http2 and DEBUG_BETCO:
+        print("[BETCO] BETCO_HTTP2 açık ama 'h2' paketi yok, HTTP/1.1 kullanılıyor")
+    BETCO_HTTP = httpx.AsyncClient(
+        timeout=httpx.Timeout(BETCO_TIMEOUT),
+        verify=VERIFY_SSL,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=BETCO_MAX_CONNECTIONS,
+            max_keepalive_connections=BETCO_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=BETCO_KEEPALIVE_EXPIRY,
+        ),
+    )
+    BETCO_HTTP_KEY = key
+
+    if old is not None and not old.is_closed:
+        try:
+            asyncio.get_running_loop().create_task(_close_client_later(old, BETCO_TIMEOUT + 5))
+        except RuntimeError:
+            pass
+    return BETCO_HTTP
+
+
+async def close_betco_client() -> None:
+    global BETCO_HTTP, BETCO_HTTP_KEY
+    if BETCO_HTTP is not None and not BETCO_HTTP.is_closed:
+        await BETCO_HTTP.aclose()
+    BETCO_HTTP = None
+    BETCO_HTTP_KEY = None
+
+
+# ----------------------
+# Betco auth varyant öğrenme
+# ----------------------
+# Panel config header'ları değiştirdikçe artar
+BETCO_CFG_VERSION: int = 0
+# (config version, variants) — her çağrıda yeniden kurulmasın
+_AUTH_VARIANTS_CACHE: tuple[int, list[dict[str, str]]] | None = None
+# path -> en son çalışan varyantın index'i
+AUTH_PREFERRED: dict[str, int] = {}
+# hit: öğrenilen varyant ilk denemede çalıştı, fallback: 401 sonrası diğerleri denendi,
+# discover: henüz öğrenilmemiş path, fail: hiçbir varyant çalışmadı
+AUTH_STATS: dict[str, int] = {"hit": 0, "fallback": 0, "discover": 0, "fail": 0}
+
+
+def _betco_cfg_fingerprint() -> tuple:
+    return (API_COOKIES, API_AUTHENTICATION, API_AUTHTOKEN, ORIGIN, REFERER, USER_AGENT,
+            API_LANG, APP_VERSION, PARTNER_ID, EXTRA_JSON)
+
+
+def _betco_variants() -> list[dict[str, str]]:
+    global _AUTH_VARIANTS_CACHE
+    if _AUTH_VARIANTS_CACHE is None or _AUTH_VARIANTS_CACHE[0] != BETCO_CFG_VERSION:
+        _AUTH_VARIANTS_CACHE = (BETCO_CFG_VERSION, _auth_variants(_build_headers_base()))
+    return _AUTH_VARIANTS_CACHE[1]
+
+
+async def _betco_send(client: httpx.AsyncClient, method: str, url: str, path: str,
+                      headers: dict[str, str], params: dict | None, payload: dict | None,
+                      discovery: bool = False) -> httpx.Response:
+    """
+    Tek HTTP isteği: breaker + adaptif limiter + bütçeli, jitter'lı retry.
+    401 ve diğer 4xx'ler upstream arızası sayılmaz, çağırana döner.
+    discovery: var olup olmadığı bilinmeyen endpoint denemesi (bonus adayları). Limiter
+    token'ı ortak hızdan düşer ama 4xx/5xx "endpoint yok" demektir: breaker'a ve AIMD'ye
+    yazılmaz, retry yapılmaz; breaker açıksa hiç gönderilmez.
+    """
+    if discovery:
+        await BETCO_LIMITER.acquire()
+        if BETCO_BREAKER.is_open():
+            metric_inc("breaker_rejected_total", upstream=BETCO_BREAKER.name)
+            raise UpstreamUnavailable(f"{BETCO_BREAKER.name} circuit open")
+        started = time.perf_counter()
+        try:
+            if method == "GET":
+                r = await client.get(url, headers=headers, params=params)
+            else:
+                r = await client.post(url, headers=headers, json=payload)
+        except httpx.TransportError:
+            metric_inc("betco_http_total", path=path, method=method, status="exception")
+            raise
+        finally:
+            metric_observe("betco_http_seconds", time.perf_counter() - started, path=path, method=method)
+        metric_inc("betco_http_total", path=path, method=method, status=str(r.status_code))
+        return r
+
+    BETCO_RETRY_BUDGET.on_request()
+    attempt = 0
+    while True:
+        # limiter beklemesi breaker'dan önce: orada iptal edilen çağrı deneme hakkını tutmaz
+        await BETCO_LIMITER.acquire()
+        probe = BETCO_BREAKER.before_call()
+        started = time.perf_counter()
+        try:
+            if method == "GET":
+                r = await client.get(url, headers=headers, params=params)
+            else:
+                r = await client.post(url, headers=headers, json=payload)
+        except httpx.TransportError:
+            metric_inc("betco_http_total", path=path, method=method, status="exception")
+            BETCO_BREAKER.record(False)
+            if attempt >= BETCO_RETRIES or not BETCO_RETRY_BUDGET.try_spend():
+                raise
+        except BaseException as e:
+            BETCO_BREAKER.abandon(probe, isinstance(e, asyncio.CancelledError))
+            raise
+        else:
+            metric_inc("betco_http_total", path=path, method=method, status=str(r.status_code))
+            retryable = _is_retryable_status(r.status_code)
+            BETCO_BREAKER.record(not retryable)
+            if not retryable:
+                BETCO_LIMITER.on_success()
+                return r
+            BETCO_LIMITER.on_throttle()
+            if attempt >= BETCO_RETRIES or not BETCO_RETRY_BUDGET.try_spend():
+                return r
+        finally:
+            metric_observe("betco_http_seconds", time.perf_counter() - started, path=path, method=method)
+        metric_inc("upstream_retry_total", upstream="betco")
+        await _backoff(attempt)
+        attempt += 1
+
+
+async def _betco_request(method: str, path: str, params: dict | None = None, payload: dict | None = None,
+                         discovery: bool = False) -> dict:
     url = f"{API_BASE}{path if path.startswith('/') else '/' + path}"
-    base_headers = _build_headers_base()
-    variants = _auth_variants(base_headers)
+    variants = _betco_variants()
+    version = BETCO_CFG_VERSION
+    client = _betco_client()
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(BETCO_TIMEOUT), verify=VERIFY_SSL) as client:
-        last_401 = None
-        last_err = None
+    preferred = AUTH_PREFERRED.get(path)
+    if preferred is not None and preferred < len(variants):
+        order = [preferred] + [i for i in range(len(variants)) if i != preferred]
+    else:
+        preferred = None
+        order = list(range(len(variants)))
+        AUTH_STATS["discover"] += 1
 
-        for h in variants:
-            try:
-                r = await client.post(url, headers=h, json=payload)
-                if r.status_code == 401:
-                    last_401 = "401"
-                    continue
-                if not r.is_success:
-                    raise RuntimeError(f"{path} HTTP {r.status_code}: {r.text[:220]}")
-                return r.json()
-            except Exception as e:
-                last_err = e
+    last_401 = None
+    last_err = None
+
+    for n, i in enumerate(order):
+        try:
+            r = await _betco_send(client, method, url, path, variants[i], params, payload, discovery)
+            if r.status_code == 401:
+                last_401 = "401"
                 continue
+            if not r.is_success:
+                raise RuntimeError(f"{path} HTTP {r.status_code}: {r.text[:220]}")
+            data = r.json()
+        except Exception as e:
+            # öğrenilmiş varyant varsa diğerleri sadece 401'den sonra denenir;
+            # breaker açıldıysa kalan varyantları denemek anlamsız; keşifte 401 dışı hata
+            # endpoint'in olmadığını gösterir, auth varyantıyla ilgisi yok
+            if preferred is not None or discovery or isinstance(e, UpstreamUnavailable):
+                raise
+            last_err = e
+            continue
 
-        if last_err:
-            raise last_err
-        raise RuntimeError(last_401 or "Betco auth failed")
+        if preferred is not None:
+            AUTH_STATS["hit" if n == 0 else "fallback"] += 1
+            if n > 0 and DEBUG_BETCO:
+                print(f"[BETCO AUTH] {path}: varyant {preferred} -> {i}")
+        if version == BETCO_CFG_VERSION:
+            AUTH_PREFERRED[path] = i
+        return data
 
+    AUTH_STATS["fail"] += 1
+    AUTH_PREFERRED.pop(path, None)
+    if last_err:
+        raise last_err
+    raise RuntimeError(last_401 or "Betco auth failed")
 
-async def betco_get_json(path: str, params: dict) -> dict:
-    url = f"{API_BASE}{path if path.startswith('/') else '/' + path}"
-    base_headers = _build_headers_base()
-    variants = _auth_variants(base_headers)
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(BETCO_TIMEOUT), verify=VERIFY_SSL) as client:
-        last_401 = None
-        last_err = None
+async def betco_post_json(path: str, payload: dict, discovery: bool = False) -> dict:
+    return await _betco_request("POST", path, payload=payload, discovery=discovery)
 
-        for h in variants:
-            try:
-                r = await client.get(url, headers=h, params=params)
-                if r.status_code == 401:
-                    last_401 = "401"
-                    continue
-                if not r.is_success:
-                    raise RuntimeError(f"{path} HTTP {r.status_code}: {r.text[:220]}")
-                return r.json()
-            except Exception as e:
-                last_err = e
-                continue
 
-        if last_err:
-            raise last_err
-        raise RuntimeError(last_401 or "Betco auth failed")
+async def betco_get_json(path: str, params: dict, discovery: bool = False) -> dict:
+    return await _betco_request("GET", path, params=params, discovery=discovery)
 
 
 async def betco_get_client_id_by_login(login: str) -> int | None:
@@ -662,6 +2433,104 @@ async def betco_get_client_id_by_login(login: str) -> int | None:
         return None
 
 
+# ----------------------
+# Login -> clientId haritası (GetClients aramasını atlamak için)
+# ----------------------
+def _client_id_db() -> sqlite3.Connection:
+    con = sqlite3.connect(CLIENT_ID_DB_PATH)
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS client_ids ("
+        "login TEXT PRIMARY KEY, client_id INTEGER, updated_at REAL NOT NULL)"
+    )
+    return con
+
+
+def load_client_ids() -> int:
+    if not CLIENT_ID_DB_PATH or not os.path.exists(CLIENT_ID_DB_PATH):
+        return 0
+    try:
+        con = _client_id_db()
+        try:
+            rows = con.execute("SELECT login, client_id, updated_at FROM client_ids").fetchall()
+        finally:
+            con.close()
+    except Exception as e:
+        print("[CLIENT ID] harita okunamadı:", repr(e))
+        return 0
+    for login, cid, ts in rows:
+        CLIENT_IDS[login] = (cid, ts)
+    return len(rows)
+
+
+def _store_client_id_sync(login: str, client_id: int | None, ts: float) -> None:
+    con = _client_id_db()
+    try:
+        con.execute("INSERT OR REPLACE INTO client_ids VALUES (?, ?, ?)", (login, client_id, ts))
+        con.commit()
+    finally:
+        con.close()
+
+
+def _client_id_fresh(hit: tuple[int | None, float] | None, now: float) -> bool:
+    if hit is None:
+        return False
+    cid, ts = hit
+    return (now - ts) < (CLIENT_ID_POSITIVE_TTL if cid is not None else CLIENT_ID_NEGATIVE_TTL)
+
+
+async def resolve_client_id(login: str) -> int | None:
+    """
+    Bulunan id CLIENT_ID_POSITIVE_TTL, bulunamayan login CLIENT_ID_NEGATIVE_TTL
+    boyunca tekrar aranmaz.
+    """
+    hit = CLIENT_IDS.get(login)
+    if _client_id_fresh(hit, time.time()):
+        return hit[0]
+
+    try:
+        cid = await betco_get_client_id_by_login(login)
+    except Exception:
+        # süresi dolmuş ama bulunmuş id, doğrulama yapılamazken kullanılmaya devam eder
+        if hit is not None and hit[0] is not None:
+            return hit[0]
+        raise
+    ts = time.time()
+    CLIENT_IDS[login] = (cid, ts)
+    if CLIENT_ID_DB_PATH:
+        try:
+            await asyncio.to_thread(_store_client_id_sync, login, cid, ts)
+        except Exception as e:
+            print("[CLIENT ID] yazılamadı:", repr(e))
+    return cid
+
+
+async def prefetch_client_ids() -> int:
+    """
+    USER_INDEX'te olup haritada olmayan veya kaydının süresi dolmuş login'leri
+    sınırlı eşzamanlılıkla, SCHEDULER'ın arkaplan kiracısı olarak çözer.
+    """
+    now = time.time()
+    todo = [u for u in list(USER_INDEX) if not _client_id_fresh(CLIENT_IDS.get(u), now)]
+    todo = todo[:max(CLIENT_ID_PREFETCH_BATCH, 0)]
+    if not todo:
+        return 0
+    sem = asyncio.Semaphore(max(CLIENT_ID_PREFETCH_CONCURRENCY, 1))
+
+    async def one(login: str) -> bool:
+        async with sem:
+            try:
+                await SCHEDULER.run(None, "betco", f"cid:{login}", lambda: resolve_client_id(login),
+                                    timeout=BETCO_TIMEOUT + 2)
+                return True
+            except Exception:
+                return False
+
+    done = sum(await asyncio.gather(*(one(u) for u in todo)))
+    if DEBUG_BETCO:
+        print(f"[CLIENT ID] prefetch: {done}/{len(todo)} çözüldü, harita={len(CLIENT_IDS)}")
+    return done
+
+
 def pick_ci(d: dict, *names: str):
     if not isinstance(d, dict):
         return None
@@ -731,7 +2600,7 @@ def latest_bonus_from_list(bonuses: list[dict]) -> dict | None:
             "updatedAt", "updated_at", "UpdatedAt",
             "date", "Date", "bonusDate", "BonusDate",
         ])
-        d = parse_any_date(dt)
+        d = parse_any_date(dt, "bonus.date")
         if d:
             return d
 
@@ -740,7 +2609,7 @@ def latest_bonus_from_list(bonuses: list[dict]) -> dict | None:
             "createdAt", "created_at", "CreatedAt",
             "CreateDate", "createDate"
         ])
-        return parse_any_date(created)
+        return parse_any_date(created, "bonus.created")
 
     scored = []
     for b in bonuses:
@@ -783,37 +2652,282 @@ def latest_bonus_from_list(bonuses: list[dict]) -> dict | None:
     return {"name": str(name) if name is not None else None, "amount": amt_num, "date_raw": date_raw}
 
 
+# (method, path) — deneme sırası; params/payload _bonus_request'te client id ile kurulur
+BONUS_CANDIDATES: list[tuple[str, str]] = [
+    ("GET",  "/Bonus/GetClientBonuses"),
+    ("GET",  "/Client/GetClientBonuses"),
+    ("GET",  "/Bonus/GetWageringBonuses"),
+    ("POST", "/Bonus/GetClientBonuses"),
+    ("POST", "/Client/GetClientBonuses"),
+]
+# Son keşifte veri dönen ilk aday (BONUS_CANDIDATES index'i); önce o denenir
+BONUS_ENDPOINT: int | None = None
+
+
+def _bonus_request(idx: int, client_id: int, discovery: bool):
+    method, path = BONUS_CANDIDATES[idx]
+    if method == "GET":
+        params = {"clientId": client_id} if path == "/Bonus/GetWageringBonuses" else {"id": client_id}
+        return betco_get_json(path, params, discovery=discovery)
+    return betco_post_json(path, {"ClientId": client_id, "SkeepRows": 0, "MaxRows": 50}, discovery=discovery)
+
+
+async def _probe_bonus(idx: int, client_id: int, discovery: bool = True) -> tuple[bool, dict | None]:
+    """
+    discovery: öğrenilmemiş aday; hatası Betco breaker/limiter'ını etkilemez, retry edilmez
+    Returns: (endpoint hatasız cevap verdi mi, en son bonus)
+    """
+    try:
+        raw = await _bonus_request(idx, client_id, discovery)
+    except Exception:
+        return (False, None)
+    if isinstance(raw, dict) and raw.get("HasError") is True:
+        return (False, None)
+    return (True, latest_bonus_from_list(_extract_bonus_objects(raw)))
+
+
 async def betco_fetch_latest_bonus_by_client_id(client_id: int) -> dict | None:
-    candidates = [
-        ("GET",  "/Bonus/GetClientBonuses", {"id": client_id}, None),
-        ("GET",  "/Client/GetClientBonuses", {"id": client_id}, None),
-        ("GET",  "/Bonus/GetWageringBonuses", {"clientId": client_id}, None),
-        ("POST", "/Bonus/GetClientBonuses", None, {"ClientId": client_id, "SkeepRows": 0, "MaxRows": 50}),
-        ("POST", "/Client/GetClientBonuses", None, {"ClientId": client_id, "SkeepRows": 0, "MaxRows": 50}),
-    ]
+    global BONUS_ENDPOINT
+
+    known = BONUS_ENDPOINT
+    if known is not None:
+        ok, latest = await _probe_bonus(known, client_id, discovery=False)
+        if latest:
+            return latest
+        if not ok:
+            BONUS_ENDPOINT = None
+        # boş liste: diğer adaylar sırayla (ör. /Bonus/GetWageringBonuses) yine denenir
+
+    # kalan adaylar eşzamanlı çalışır ama sonuç sıralı denemeyle aynı: veri dönen ilk aday
+    # kazanır, ondan önceki adayların hepsi (hata / boş) bitmeden karar verilmez
+    order = [i for i in range(len(BONUS_CANDIDATES)) if i != known]
+    tasks = {i: asyncio.create_task(_probe_bonus(i, client_id)) for i in order}
+    pending = set(tasks.values())
+    try:
+        while True:
+            for i in order:
+                t = tasks[i]
+                if not t.done():
+                    break
+                ok, latest = t.result()
+                if latest:
+                    BONUS_ENDPOINT = i
+                    return latest
+            else:
+                return None
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in tasks.values():
+            if not t.done():
+                t.cancel()
 
-    for method, path, params, payload in candidates:
-        try:
-            raw = await (betco_get_json(path, params or {}) if method == "GET" else betco_post_json(path, payload or {}))
-            if isinstance(raw, dict) and raw.get("HasError") is True:
-                continue
-            objs = _extract_bonus_objects(raw)
-            latest = latest_bonus_from_list(objs)
-            if latest:
-                return latest
-        except Exception:
-            continue
 
-    return None
+def _with_age(out: dict, fetched_at: float, now: float) -> dict:
+    # TTL'den eski veri dönülüyorsa cevapta yaşı gösterilsin
+    age = now - fetched_at
+    return {**out, "ageSeconds": age} if age > BETCO_CACHE_TTL else out
+
+
+def _betco_cache_get(login: str, now: float | None = None) -> dict | None:
+    cached = BETCO_CACHE.get(login)
+    if cached is None:
+        return None
+    now = now if now is not None else time.time()
+    if now >= cached[0]:
+        if cached[1].get("status") != "OK" or now - cached[2] > BETCO_CACHE_TTL + BETCO_CACHE_STALE_GRACE:
+            BETCO_CACHE.pop(login, None)
+        return None
+    BETCO_CACHE.move_to_end(login)
+    return _with_age(cached[1], cached[2], now)
+
+
+def _betco_cache_stale(login: str, now: float | None = None) -> dict | None:
+    """
+    Süresi dolmuş ama grace penceresindeki OK sonuç (yaşıyla); yoksa None.
+    """
+    cached = BETCO_CACHE.get(login)
+    if cached is None or cached[1].get("status") != "OK":
+        return None
+    now = now if now is not None else time.time()
+    if now - cached[2] > BETCO_CACHE_TTL + BETCO_CACHE_STALE_GRACE:
+        return None
+    return {**cached[1], "ageSeconds": now - cached[2]}
+
+
+def _betco_cache_backoff(login: str) -> None:
+    # tazeleme başarısızsa eski OK sonuç kısa süre taze sayılır; her sorgu Betco'ya gitmesin
+    cached = BETCO_CACHE.get(login)
+    if cached is not None and cached[1].get("status") == "OK" and _betco_cache_stale(login) is not None:
+        BETCO_CACHE[login] = (time.time() + BETCO_CACHE_ERROR_TTL, cached[1], cached[2])
+
+
+def _betco_cache_put(login: str, out: dict) -> None:
+    status = out.get("status")
+    if status == "not_found":
+        ttl = BETCO_CACHE_NOT_FOUND_TTL
+    elif status == "error":
+        if _betco_cache_stale(login) is not None:
+            _betco_cache_backoff(login)
+            return
+        ttl = BETCO_CACHE_ERROR_TTL
+    else:
+        ttl = BETCO_CACHE_TTL
+    now = time.time()
+    BETCO_CACHE[login] = (now + ttl, out, now)
+    BETCO_CACHE.move_to_end(login)
+    while len(BETCO_CACHE) > max(BETCO_CACHE_MAX, 1):
+        BETCO_CACHE.popitem(last=False)
+
+
+def _drop_inflight(login: str, task: asyncio.Task) -> None:
+    if BETCO_INFLIGHT.get(login) is task:
+        BETCO_INFLIGHT.pop(login, None)
+    # bekleyen kalmadıysa "exception was never retrieved" uyarısı çıkmasın
+    if not task.cancelled() and task.exception() is not None:
+        _betco_cache_backoff(login)
+
+
+def _start_betco_fetch(login: str) -> asyncio.Task:
+    task = asyncio.create_task(_betco_fetch_kpi_uncached(login))
+    BETCO_INFLIGHT[login] = task
+    task.add_done_callback(lambda t, k=login: _drop_inflight(k, t))
+    return task
+
+
+def _hot_score(login: str, now: float) -> float:
+    score, at = HOT_LOGINS.get(login, (0.0, now))
+    return score * 0.5 ** ((now - at) / HOT_HALF_LIFE) if HOT_HALF_LIFE > 0 else score
+
+
+def _hot_touch(login: str, now: float) -> None:
+    HOT_LOGINS[login] = (_hot_score(login, now) + 1, now)
 
 
 async def betco_fetch_kpi_by_login(login: str) -> dict:
     now = time.time()
-    cached = BETCO_CACHE.get(login)
-    if cached and now < cached[0]:
-        return cached[1]
+    _hot_touch(login, now)
+    cached = _betco_cache_get(login, now)
+    if cached is not None:
+        metric_inc("betco_cache_total", result="hit")
+        return cached
+
+    # stale-while-revalidate: eski sonuç hemen döner, tazeleme arkaplanda (SCHEDULER'ın
+    # düşük öncelikli kiracısı olarak: kullanıcı sorgularının Betco slotlarını yemesin)
+    stale = _betco_cache_stale(login, now)
+    if stale is not None:
+        metric_inc("betco_cache_total", result="stale")
+        if (login not in BETCO_INFLIGHT and f"betco:{login}" not in SCHEDULER.pending
+                and not BETCO_BREAKER.is_open()):
+            SCHEDULER.run_background("betco", f"betco:{login}", lambda: refresh_betco_kpi(login),
+                                     timeout=BETCO_TIMEOUT + 2)
+        return stale
+
+    task = BETCO_INFLIGHT.get(login)
+    if task is not None:
+        metric_inc("betco_cache_total", result="coalesced")
+    else:
+        metric_inc("betco_cache_total", result="miss")
+        task = _start_betco_fetch(login)
+    # bir çağıranın timeout'u diğerlerinin beklediği zinciri iptal etmesin
+    return await asyncio.shield(task)
+
+
+async def refresh_betco_kpi(login: str) -> dict:
+    """
+    Cache'e bakmadan tazeler (sürmekte olan zincire bağlanır); arkaplan işlerinin factory'si.
+    """
+    task = BETCO_INFLIGHT.get(login) or _start_betco_fetch(login)
+    return await asyncio.shield(task)
+
+
+async def scheduled_betco_fetch(chat_id: int, login: str) -> dict:
+    """
+    Cache'ten (taze ya da eski) cevaplanabilen sorgu slot beklemez; gerisi SCHEDULER'dan geçer.
+    Zaman aşımı (BETCO_TIMEOUT + 2) iş slot alınca başlar, kuyrukta bekleme sayılmaz.
+    """
+    if _betco_cache_get(login) is not None or _betco_cache_stale(login) is not None:
+        return await betco_fetch_kpi_by_login(login)
+    return await SCHEDULER.run(chat_id, "betco", f"betco:{login}", lambda: betco_fetch_kpi_by_login(login),
+                               timeout=BETCO_TIMEOUT + 2)
 
-    client_id = await betco_get_client_id_by_login(login)
+
+async def scheduled_member_detail(chat_id: int, member_id: int) -> dict | None:
+    return await SCHEDULER.run(chat_id, "panel", f"detail:{member_id}", lambda: get_member_detail(member_id))
+
+
+def betco_cached_fallback(login: str) -> dict | None:
+    """
+    Canlı sorgu yapılamadığında (breaker açık, timeout, hata) gösterilecek eski sonuç.
+    """
+    out = _betco_cache_stale(login)
+    if out is not None:
+        metric_inc("betco_cache_total", result="fallback")
+    return out
+
+
+def _prefetch_candidates(now: float) -> list[str]:
+    """
+    Skoru HOT_MIN_SCORE üstündeki ilk BETCO_PREFETCH_TOP login'den cache kaydı olup
+    BETCO_PREFETCH_LEAD içinde bitecek (ya da yeni bitmiş) olanlar, en sıcak önce.
+    Cache'ten düşmüş login tazelenmez: bir sonraki sorgusu normal yoldan çeker.
+    """
+    scored = []
+    for login in list(HOT_LOGINS):
+        score = _hot_score(login, now)
+        if score < 0.05:
+            HOT_LOGINS.pop(login, None)
+        elif score >= HOT_MIN_SCORE:
+            scored.append((score, login))
+    if len(HOT_LOGINS) > HOT_MAX:
+        for _, login in sorted((v[0], k) for k, v in HOT_LOGINS.items())[:len(HOT_LOGINS) - HOT_MAX]:
+            HOT_LOGINS.pop(login, None)
+
+    out: list[str] = []
+    for _, login in heapq.nlargest(max(BETCO_PREFETCH_TOP, 0), scored):
+        if login in BETCO_INFLIGHT:
+            continue
+        cached = BETCO_CACHE.get(login)
+        if cached is None or cached[0] - now > BETCO_PREFETCH_LEAD or cached[1].get("status") == "error":
+            continue
+        out.append(login)
+        if len(out) >= BETCO_PREFETCH_MAX_PER_RUN:
+            break
+    return out
+
+
+async def prefetch_hot_betco() -> int:
+    """
+    Sıcak login'lerin Betco sonucunu süre dolmadan tazeler; SCHEDULER'dan arkaplan işi
+    olarak geçer, kullanıcı sorgusu aynı anda gelirse aynı işe bağlanır (ve öne alınır).
+    """
+    if BETCO_BREAKER.is_open():
+        return 0
+    todo = _prefetch_candidates(time.time())
+    if not todo:
+        return 0
+    sem = asyncio.Semaphore(max(BETCO_PREFETCH_CONCURRENCY, 1))
+
+    async def one(login: str) -> bool:
+        async with sem:
+            if login in BETCO_INFLIGHT or BETCO_BREAKER.is_open():
+                return False
+            try:
+                out = await SCHEDULER.run(None, "betco", f"betco:{login}", lambda: refresh_betco_kpi(login),
+                                          timeout=BETCO_TIMEOUT + 2)
+                ok = out.get("status") != "error"
+            except Exception:
+                ok = False
+            metric_inc("betco_prefetch_total", result="ok" if ok else "fail")
+            return ok
+
+    done = sum(await asyncio.gather(*(one(u) for u in todo)))
+    if DEBUG_BETCO:
+        print(f"[BETCO PREFETCH] {done}/{len(todo)} tazelendi, sıcak={len(HOT_LOGINS)}")
+    return done
+
+
+async def _betco_fetch_kpi_uncached(login: str) -> dict:
+    client_id = await resolve_client_id(login)
     if not client_id:
         out = {
             "status": "not_found",
@@ -824,7 +2938,7 @@ async def betco_fetch_kpi_by_login(login: str) -> dict:
             "latestBonusAmount": None,
             "latestBonusDate": None,
         }
-        BETCO_CACHE[login] = (time.time() + BETCO_CACHE_TTL, out)
+        _betco_cache_put(login, out)
         return out
 
     bonus_task = asyncio.create_task(betco_fetch_latest_bonus_by_client_id(client_id))
@@ -844,7 +2958,7 @@ async def betco_fetch_kpi_by_login(login: str) -> dict:
             "latestBonusDate": None,
             "message": msg,
         }
-        BETCO_CACHE[login] = (time.time() + BETCO_CACHE_TTL, out)
+        _betco_cache_put(login, out)
         return out
 
     last_amt = pick_ci(kpi, "LastDepositAmount", "DepositAmount", "TotalDeposit")
@@ -869,15 +2983,24 @@ async def betco_fetch_kpi_by_login(login: str) -> dict:
         "lastDepositTime": last_time,
         "latestBonusName": (latest_bonus or {}).get("name") if latest_bonus else None,
         "latestBonusAmount": (latest_bonus or {}).get("amount") if latest_bonus else None,
-        "latestBonusDate": fmt_ddmmyyyy((latest_bonus or {}).get("date_raw")) if latest_bonus else None,
+        "latestBonusDate": fmt_ddmmyyyy((latest_bonus or {}).get("date_raw"), "bonus.date") if latest_bonus else None,
     }
-    BETCO_CACHE[login] = (time.time() + BETCO_CACHE_TTL, out)
+    _betco_cache_put(login, out)
     return out
 
 
 # ======================
 # Output formatter (temiz mesaj)
 # ======================
+def fmt_age(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "1 dk'dan az"
+    if minutes < 60:
+        return f"{minutes} dk"
+    return f"{minutes // 60} sa {minutes % 60} dk"
+
+
 def build_final_message(username: str, panel_block: str, b: dict | None, reward_name: str, reward_date: str) -> str:
     # Betco kısmı yok (başlık kaldırıldı), nokta/bullet yok
     if not b or b.get("status") != "OK":
@@ -893,7 +3016,7 @@ def build_final_message(username: str, panel_block: str, b: dict | None, reward_
         bonus_amt = fmt_amount(b.get("latestBonusAmount")) if b.get("latestBonusAmount") is not None else "-"
         bonus_date = b.get("latestBonusDate") or "-"
 
-    return (
+    text = (
         f"Kullanıcı Adı: {username}\n\n"
         f"{panel_block}\n"
         f"Son Yatırım Miktarı: {dep_amt}\n"
@@ -904,6 +3027,9 @@ def build_final_message(username: str, panel_block: str, b: dict | None, reward_
         f"Son Aldığı Seviye Ödülü: {reward_name}\n"
         f"Seviye Ödül Tarihi: {reward_date}\n"
     )
+    if b and b.get("status") == "OK" and b.get("ageSeconds") is not None:
+        text += f"\n⏱ Yatırım/bonus verisi {fmt_age(b['ageSeconds'])} önce alındı\n"
+    return text
 
 
 # ======================
@@ -954,7 +3080,11 @@ async def selftest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "MaxCreatedLocalDisable": True,
             "MinCreatedLocalDisable": True
         })
-        await update.message.reply_text("✅ Betco selftest OK (GetClients erişilebilir).")
+        await update.message.reply_text(
+            "✅ Betco selftest OK (GetClients erişilebilir).\n"
+            f"Auth varyant: hit={AUTH_STATS['hit']} fallback={AUTH_STATS['fallback']} "
+            f"discover={AUTH_STATS['discover']} fail={AUTH_STATS['fail']}"
+        )
     except Exception as e:
         await update.message.reply_text(f"❌ Betco selftest FAIL: {repr(e)}")
 
@@ -967,73 +3097,729 @@ async def ka(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Kullanım: /ka username")
         return
 
+    if len(parse_usernames(context.args)) > 1:
+        await kaa(update, context)
+        return
+
     username = context.args[0].strip()
+    started = time.perf_counter()
 
-    # Panel config (opsiyonel) + index
-    await refresh_panel_config(force=False)
+    # Panel config (opsiyonel): sadece hiç yüklenmediyse bekle, yoksa arkaplanda tazelenir
+    if PANEL_CONFIG_URL and not PANEL_CFG:
+        with timed("ka_stage_seconds", stage="config"):
+            await refresh_panel_config(force=False)
 
-    if not USER_INDEX:
+    # snapshot yüklenirken beklenmez: bulunamayan üye panelden tekil sorguyla gelir
+    if not USER_INDEX and not snapshot_loading():
         await update.message.reply_text("🔄 İlk indeks hazırlanıyor...")
-        ok = await refresh_index(force=True)
-        if not ok or not USER_INDEX:
+        if not await ensure_index():
             await update.message.reply_text("⚠️ Panelden indeks alınamadı. Tekrar dene.")
             return
 
     maybe_refresh_config_background()
     maybe_trigger_refresh_in_background()
 
-    item = USER_INDEX.get(username)
-    if not item:
-        await update.message.reply_text(f"❌ Bulunamadı: {username}")
+    with timed("ka_stage_seconds", stage="index"):
+        found = await lookup_member_wait(username)
+    if not found:
+        # son refresh'ten sonra eklenmiş üye olabilir
+        with timed("ka_stage_seconds", stage="point_lookup"):
+            found = await panel_lookup_member(username)
+    if not found:
+        with timed("ka_stage_seconds", stage="suggest"):
+            hints = await asyncio.to_thread(suggest_usernames, username)
+        await update.message.reply_text(
+            f"❌ Bulunamadı: {username}"
+            + (f"\nBunu mu demek istediniz: {', '.join(hints)}" if hints else "")
+        )
+        metric_inc("ka_total", result="not_found")
         return
+    username, item = found
 
     panel_block = format_panel_block(item)
 
-    # Member detail ile reward bilgisi
-    member_id = item.get("id")
+    # Panel detayı (reward) ve Betco zinciri birbirinden bağımsız: ikisi de hemen başlar
+    member_id = item.id
+    chat_id = update.effective_chat.id
+    detail_task = asyncio.create_task(
+        timed_coro(scheduled_member_detail(chat_id, member_id), "ka_stage_seconds", stage="member_detail")
+    ) if isinstance(member_id, int) else None
+    # Betco devre dışıysa (breaker açık) beklemeden sadece panel bilgisiyle cevap verilir
+    betco_task = asyncio.create_task(
+        timed_coro(scheduled_betco_fetch(chat_id, username), "ka_stage_seconds", stage="betco")
+    ) if not BETCO_BREAKER.is_open() else None
+
+    # “Sorgulanıyor” yerine: panel bloğu hazır, ilk cevap beklemeden gider
+    with timed("ka_stage_seconds", stage="first_reply"):
+        msg = await update.message.reply_text(
+            f"Kullanıcı Adı: {username}\n\n{panel_block}\nYatırım hesaplanıyor..."
+        )
+    metric_observe("ka_stage_seconds", time.perf_counter() - started, stage="time_to_first_reply")
+
     reward_name, reward_date = "-", "-"
-    if isinstance(member_id, int):
+    if detail_task is not None:
         try:
-            member = await asyncio.to_thread(_get_member_detail_sync, member_id)
+            member = await detail_task
             reward_name, reward_date = _latest_level_reward_from_member(member)
         except Exception:
             reward_name, reward_date = "-", "-"
 
-    betco_task = asyncio.create_task(betco_fetch_kpi_by_login(username))
-
-    # “Sorgulanıyor” yerine
-    msg = await update.message.reply_text(
-        f"Kullanıcı Adı: {username}\n\n{panel_block}\nYatırım hesaplanıyor..."
-    )
+    b = None
+    if betco_task is not None:
+        try:
+            b = await betco_task
+        except UpstreamUnavailable as e:
+            print("[BETCO]", e)
+        except Exception as e:
+            print("\n[BETCO ERROR]", repr(e))
+            print(traceback.format_exc())
+    if not b or b.get("status") != "OK":
+        b = betco_cached_fallback(username) or b
 
-    try:
-        b = await asyncio.wait_for(betco_task, timeout=BETCO_TIMEOUT + 2)
-        final_text = build_final_message(username, panel_block, b, reward_name, reward_date)
+    final_text = build_final_message(username, panel_block, b, reward_name, reward_date)
+    with timed("ka_stage_seconds", stage="edit"):
         try:
             await msg.edit_text(final_text)
         except Exception:
             await update.message.reply_text(final_text)
+    metric_observe("ka_stage_seconds", time.perf_counter() - started, stage="total")
+    if b and b.get("status") == "OK":
+        metric_inc("ka_total", result="stale" if b.get("ageSeconds") is not None else "ok")
+    else:
+        metric_inc("ka_total", result="degraded")
+
+
+# ----------------------
+# Toplu sorgu
+# ----------------------
+def parse_usernames(args: list[str]) -> list[str]:
+    out: list[str] = []
+    seen: set[str] = set()
+    for a in args:
+        for u in re.split(r"[\s,;]+", a):
+            u = u.strip()
+            if u and u not in seen:
+                seen.add(u)
+                out.append(u)
+    return out
+
+
+async def _batch_lookup_one(chat_id: int, username: str, item: VipMember) -> tuple[dict | None, str, str]:
+    """
+    Returns: (betco sonucu, ödül adı, ödül tarihi). Global BATCH_SEM ile sınırlı,
+    istekler SCHEDULER'da chat'in kuyruğuna girer.
+    """
+    async with BATCH_SEM:
+        member_id = item.id
+        detail_task = asyncio.create_task(scheduled_member_detail(chat_id, member_id)) if isinstance(member_id, int) else None
+        betco_task = asyncio.create_task(scheduled_betco_fetch(chat_id, username)) if not BETCO_BREAKER.is_open() else None
+
+        reward_name, reward_date = "-", "-"
+        if detail_task is not None:
+            try:
+                reward_name, reward_date = _latest_level_reward_from_member(await detail_task)
+            except Exception:
+                pass
+        b = None
+        if betco_task is not None:
+            try:
+                b = await betco_task
+            except Exception as e:
+                if DEBUG_BETCO:
+                    print(f"[BATCH] {username} betco:", repr(e))
+        if not b or b.get("status") != "OK":
+            b = betco_cached_fallback(username) or b
+        return b, reward_name, reward_date
+
+
+def _batch_columns(username: str, item: VipMember | None, b: dict | None, reward_name: str, reward_date: str) -> list[str]:
+    if item is None:
+        return [username, "bulunamadı"] + ["-"] * 9
+    ok = bool(b) and b.get("status") == "OK"
+    return [
+        username,
+        str(item.level_name),
+        item.deposit90d_tl,
+        item.remaining_tl,
+        fmt_tl(b.get("lastDepositAmount")) if ok and b.get("lastDepositAmount") is not None else "-",
+        fmt_deposit_date(b.get("lastDepositTime")) if ok else "-",
+        (b.get("latestBonusName") or "-") if ok else "-",
+        fmt_amount(b.get("latestBonusAmount")) if ok and b.get("latestBonusAmount") is not None else "-",
+        (b.get("latestBonusDate") or "-") if ok else "-",
+        reward_name,
+        reward_date,
+    ]
+
+
+BATCH_HEADER = [
+    "Kullanıcı Adı", "VIP Seviye", "90 Gün Yatırım", "Sonraki Statü Kalan",
+    "Son Yatırım", "Son Yatırım Tarihi", "Bonus Adı", "Bonus Miktarı", "Bonus Tarihi",
+    "Son Seviye Ödülü", "Ödül Tarihi",
+]
+
+
+def _batch_pages(rows: list[list[str]]) -> list[str]:
+    pages: list[str] = []
+    cur = ""
+    for cols in rows:
+        if cols[1] == "bulunamadı":
+            line = f"❌ {cols[0]}"
+        else:
+            line = (
+                f"{cols[0]} | {cols[1]} | 90g {cols[2]} | kalan {cols[3]}\n"
+                f"   yat. {cols[4]} {cols[5]} | bonus {cols[6]} {cols[7]} {cols[8]} | ödül {cols[9]} {cols[10]}"
+            )
+        if cur and len(cur) + len(line) + 1 > TG_MESSAGE_LIMIT:
+            pages.append(cur)
+            cur = ""
+        cur = f"{cur}\n{line}" if cur else line
+    if cur:
+        pages.append(cur)
+    return pages
+
+
+async def kaa(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_allowed(update):
+        await update.message.reply_text("⛔ Yetkin yok.")
+        return
+    usernames = parse_usernames(context.args or [])
+    if not usernames:
+        await update.message.reply_text("Kullanım: /kaa user1 user2 user3 ...")
+        return
+    if len(usernames) > BATCH_MAX_USERNAMES:
+        await update.message.reply_text(f"⚠️ En fazla {BATCH_MAX_USERNAMES} kullanıcı, ilk {BATCH_MAX_USERNAMES} sorgulanıyor.")
+        usernames = usernames[:BATCH_MAX_USERNAMES]
+
+    if PANEL_CONFIG_URL and not PANEL_CFG:
+        await refresh_panel_config(force=False)
+    # toplu sorgu her isim için panele gitmesin: açılış snapshot'ı beklenir
+    await wait_index_snapshot()
+    if not USER_INDEX:
+        await update.message.reply_text("🔄 İlk indeks hazırlanıyor...")
+        if not await ensure_index():
+            await update.message.reply_text("⚠️ Panelden indeks alınamadı. Tekrar dene.")
+            return
+
+    maybe_refresh_config_background()
+    maybe_trigger_refresh_in_background()
+
+    # indeks aramaları tek seferde, sonra bulunanlar için sınırlı fan-out
+    found = await asyncio.gather(*(lookup_member_wait(u) for u in usernames))
+    found = list(zip(usernames, found))
+    misses = [u for u, hit in found if not hit]
+    if misses:
+        extra = dict(zip(misses, await asyncio.gather(*(panel_lookup_member(u) for u in misses))))
+        found = [(u, hit or extra.get(u)) for u, hit in found]
+    msg = await update.message.reply_text(f"🔄 {len(usernames)} kullanıcı sorgulanıyor...")
+
+    results = await asyncio.gather(*(
+        _batch_lookup_one(update.effective_chat.id, hit[0], hit[1]) if hit else asyncio.sleep(0, (None, "-", "-"))
+        for _, hit in found
+    ))
+
+    rows = [
+        _batch_columns(hit[0] if hit else u, hit[1] if hit else None, b, rn, rd)
+        for (u, hit), (b, rn, rd) in zip(found, results)
+    ]
+    n_found = sum(1 for _, hit in found if hit)
+    summary = f"✅ {n_found}/{len(usernames)} kullanıcı bulundu."
+
+    if len(rows) > BATCH_DOCUMENT_THRESHOLD:
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(BATCH_HEADER)
+        w.writerows(rows)
+        data = io.BytesIO(buf.getvalue().encode("utf-8-sig"))
+        await update.message.reply_document(document=data, filename="toplu_sorgu.csv", caption=summary)
+        try:
+            await msg.delete()
+        except Exception:
+            pass
+        return
+
+    pages = _batch_pages(rows)
+    first = f"{summary}\n\n{pages[0]}" if pages else summary
+    try:
+        await msg.edit_text(first)
+    except Exception:
+        await update.message.reply_text(first)
+    for page in pages[1:]:
+        await update.message.reply_text(page)
+
+
+# ----------------------
+# Toplu export (admin)
+# ----------------------
+EXPORT_PANEL_FIELDS = ["username", "id", "levelId", "levelName", "deposit90d", "nextLevel", "remaining"]
+EXPORT_BETCO_FIELDS = [
+    "betcoStatus", "clientId", "lastDepositAmount", "lastDepositTime",
+    "latestBonusName", "latestBonusAmount", "latestBonusDate",
+]
+
+
+def iter_export_records(items: list[VipMember], betco: dict[str, dict] | None):
+    for item in items:
+        level_name, level_id, deposit90d_raw, next_level, remaining_raw = panel_fields(item)
+        rec = {
+            "username": item.username,
+            "id": item.id,
+            "levelId": level_id,
+            "levelName": level_name,
+            "deposit90d": deposit90d_raw,
+            "nextLevel": next_level,
+            "remaining": remaining_raw,
+        }
+        if betco is not None:
+            # sadece cache'teki veri (loop'ta alınmış kopya); export Betco'ya istek atmaz
+            b = betco.get(str(rec["username"])) or {}
+            rec["betcoStatus"] = b.get("status")
+            for k in EXPORT_BETCO_FIELDS[1:]:
+                rec[k] = b.get(k)
+        yield rec
+
+
+def _betco_export_snapshot() -> dict[str, dict]:
+    # event loop'ta çağrılır: thread BETCO_CACHE'i (OrderedDict) gezerken loop onu değiştiremez
+    now = time.time()
+    return {login: c[1] for login, c in list(BETCO_CACHE.items()) if now < c[0]}
+
+
+def _write_export_sync(items: list[VipMember], fmt: str, betco: dict[str, dict] | None) -> str:
+    fields = EXPORT_PANEL_FIELDS + (EXPORT_BETCO_FIELDS if betco is not None else [])
+    fd, path = tempfile.mkstemp(prefix="vip_export_", suffix=f".{fmt}")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="") as f:
+            if fmt == "csv":
+                w = csv.DictWriter(f, fieldnames=fields)
+                w.writeheader()
+                for rec in iter_export_records(items, betco):
+                    w.writerow(rec)
+            else:
+                for rec in iter_export_records(items, betco):
+                    f.write(json.dumps(rec, ensure_ascii=False))
+                    f.write("\n")
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+async def export(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_admin(update):
+        await update.message.reply_text("⛔ Yetkin yok.")
+        return
+
+    args = [a.lower() for a in (context.args or [])]
+    fmt = "jsonl" if "jsonl" in args else "csv"
+    with_betco = "betco" in args
+
+    if not USER_INDEX or INDEX_PARTIAL:
+        await update.message.reply_text("⚠️ İndeks henüz hazır değil.")
+        return
+
+    # delta refresh dict'i yerinde değiştirir; thread'e sadece referans listesi verilir
+    items = list(USER_INDEX.values())
+    betco = _betco_export_snapshot() if with_betco else None
+    msg = await update.message.reply_text(f"🔄 {len(items)} kayıt dışa aktarılıyor...")
+    try:
+        path = await asyncio.to_thread(_write_export_sync, items, fmt, betco)
     except Exception as e:
-        print("\n[BETCO ERROR]", repr(e))
-        print(traceback.format_exc())
-        final_text = build_final_message(username, panel_block, None, reward_name, reward_date)
+        await msg.edit_text(f"❌ Export başarısız: {repr(e)}")
+        return
+
+    try:
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                document=f,
+                filename=f"vip_index_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}",
+                caption=f"✅ {len(items)} kayıt" + (" (Betco cache dahil)" if with_betco else ""),
+            )
         try:
-            await msg.edit_text(final_text)
+            await msg.delete()
         except Exception:
-            await update.message.reply_text(final_text)
+            pass
+    finally:
+        os.remove(path)
 
 
-def main() -> None:
-    app = Application.builder().token(BOT_TOKEN).build()
+# ----------------------
+# Seviye analizi /tiers (admin)
+# ----------------------
+TIERS_NEAR_TL = int(os.getenv("TIERS_NEAR_TL", "10000"))
+TIERS_NEAR_LIMIT = int(os.getenv("TIERS_NEAR_LIMIT", "10"))
+TIERS_PERCENTILES = (0.25, 0.5, 0.75, 0.9, 0.99)
+# İndeks refresh'inden sonra kolonlar arka planda yeniden kurulur; /tiers cache'ten döner
+TIERS_WARM = os.getenv("TIERS_WARM", "1").lower() in ("1", "true", "yes", "on")
+# thread'deki C çağrıları (map/sort) bu kadar elemanlık parçalarla: GIL arada loop'a geçer
+TIERS_CHUNK = 65536
+# (INDEX_VERSION, kolonlar, {yakınlık eşiği: rapor metni})
+TIERS_CACHE: tuple[int, dict, dict[int, str]] | None = None
+
+
+def _sorted_in_runs(values: array) -> list[float]:
+    """
+    sorted(values) ile aynı sonuç; ama thread'de çalışırken tek bir uzun C çağrısı GIL'i
+    tutup event loop'u bloklamasın diye TIERS_CHUNK'lık parçalar sıralanıp ikişer birleştirilir
+    (timsort iki sıralı diziyi doğrusal birleştirir). En uzun blok son birleştirme kadar.
+    """
+    runs = [sorted(values[i:i + TIERS_CHUNK]) for i in range(0, len(values), TIERS_CHUNK)]
+    while len(runs) > 1:
+        merged = []
+        for i in range(0, len(runs) - 1, 2):
+            run = runs[i]
+            run += runs[i + 1]
+            run.sort()
+            merged.append(run)
+        if len(runs) % 2:
+            merged.append(runs[-1])
+        runs = merged
+    return runs[0] if runs else []
+
+
+def _tier_columns_sync(members: list[VipMember]) -> dict:
+    """
+    Üyelerin tier_key'leri (seviye kodu * TIERS_SPAN + deposit90d) array("d") kolonuna alınıp
+    sıralanır: seviyeler sıralı listede ardışık dilimlere düşer, dilim içi deposit'e göre
+    sıralıdır. Eleman başına Python döngüsü yok: map/sort C tarafında, parça parça döner.
+    """
+    key = array("d")
+    for i in range(0, len(members), TIERS_CHUNK):
+        key.extend(map(attrgetter("tier_key"), members[i:i + TIERS_CHUNK]))
+    sk = _sorted_in_runs(key)
+    segs = {}
+    for code in list(range(len(VIP_ORDER))) + [TIER_UNKNOWN]:
+        off = code * TIERS_SPAN
+        a, b = bisect_left(sk, off - TIERS_SPAN / 2), bisect_left(sk, off + TIERS_SPAN / 2)
+        if b > a:
+            segs[code] = (a, b, off)
+    return {"n": len(members), "members": members, "key": key, "sorted": sk, "segs": segs}
+
+
+def _kth_smallest(sk: list[float], segs: list[tuple[int, int, float]], k: int) -> float:
+    """
+    (başlangıç, bitiş, ofset) dilimlerinin (değer = sk[i] - ofset) birleşimindeki k. (0 tabanlı)
+    değer; birleştirip sıralamadan, her dilim üzerinde ikili arama.
+    """
+    def rank(v: float, side) -> int:
+        return sum(side(sk, v + off, a, b) - a for a, b, off in segs)
+
+    for a, b, off in segs:
+        lo, hi = a, b
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if rank(sk[mid] - off, bisect_right) > k:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo < b and rank(sk[lo] - off, bisect_left) <= k:
+            return sk[lo] - off
+    raise ValueError("k aralık dışında")
+
+
+def _pct_index(n: int, q: float) -> int:
+    return min(n - 1, int(q * (n - 1) + 0.5))
+
+
+def _tiers_report_sync(cols: dict, near_tl: int) -> str:
+    n = cols["n"]
+    sk, segs = cols["sorted"], cols["segs"]
+    lines = [f"📈 VIP seviye analizi ({n} üye)", ""]
+    for code, lvl in list(enumerate(VIP_ORDER)) + [(TIER_UNKNOWN, None)]:
+        seg = segs.get(code)
+        if seg is None:
+            if lvl is None:
+                continue
+            lines.append(f"{VIP_TR_NAME.get(lvl, lvl)}: 0")
+            continue
+        a, b, off = seg
+        name = VIP_TR_NAME.get(lvl, lvl) if lvl else "Seviyesi bilinmeyen"
+        lines.append(
+            f"{name}: {b - a} (%{(b - a) / n * 100:.1f}) · "
+            f"p50 {fmt_tl(sk[a + _pct_index(b - a, 0.5)] - off)} · p90 {fmt_tl(sk[a + _pct_index(b - a, 0.9)] - off)}"
+        )
+
+    if segs:
+        seg_list = list(segs.values())
+        lines.append("")
+        lines.append("90 gün yatırım: " + " · ".join(
+            f"p{int(q * 100)} {fmt_tl(_kth_smallest(sk, seg_list, _pct_index(n, q)))}" for q in TIERS_PERCENTILES
+        ) + f" · max {fmt_tl(max(sk[b - 1] - off for a, b, off in seg_list))}")
+
+    # her seviye için [hedef - eşik, hedef) anahtar penceresi: sıralı listede ardışık bir dilim
+    lines.append("")
+    lines.append(f"Sonraki seviyeye ≤ {fmt_tl(near_tl)} kalanlar:")
+    half = TIERS_SPAN / 2
+    windows: dict[int, tuple[int, int, int]] = {}
+    for code, lvl in enumerate(VIP_ORDER):
+        next_level, target = VIP_NEXT_TARGET[lvl]
+        if next_level is None or code not in segs:
+            continue
+        a, b, off = segs[code]
+        hi = bisect_left(sk, off + min(float(target), half), a, b)
+        lo = bisect_left(sk, off + max(float(target - near_tl), -half), a, hi)
+        windows[code] = (lo, hi, b - bisect_left(sk, off + target, a, b))
+
+    near: dict[int, list[tuple[float, str]]] = {code: [] for code in windows}
+    near_keys = set()
+    for lo, hi, _ in windows.values():
+        near_keys.update(sk[lo:hi])
+    if near_keys and TIERS_NEAR_LIMIT > 0:
+        # pencere anahtarları küme olarak; üyeler tek geçişte (C tarafında) seçilir
+        key, members = cols["key"], cols["members"]
+        for start in range(0, n, TIERS_CHUNK):
+            stop = min(start + TIERS_CHUNK, n)
+            for i in compress(range(start, stop), map(near_keys.__contains__, key[start:stop])):
+                code = round(key[i] / TIERS_SPAN)
+                near[code].append((key[i] - code * TIERS_SPAN, members[i].username))
+
+    for code in windows:
+        lvl = VIP_ORDER[code]
+        next_level, target = VIP_NEXT_TARGET[lvl]
+        lo, hi, over_n = windows[code]
+        near_n = hi - lo
+        lines.append(
+            f"{VIP_TR_NAME.get(lvl, lvl)} → {VIP_TR_NAME.get(next_level, next_level)} "
+            f"(hedef {fmt_tl(target)}): {near_n} üye"
+            + (f" · hedefi geçmiş {over_n}" if over_n else "")
+        )
+        for dv, u in heapq.nlargest(max(TIERS_NEAR_LIMIT, 0), near[code]):
+            lines.append(f"  {u}: {fmt_tl(max(0, int(target - dv)))}")
+    return "\n".join(lines)
+
+
+def _tiers_build_and_report_sync(members: list[VipMember] | None, cols: dict | None, near_tl: int) -> tuple[dict, str]:
+    if cols is None:
+        cols = _tier_columns_sync(members)
+    return cols, _tiers_report_sync(cols, near_tl)
+
+
+async def tiers_report(near_tl: int) -> str:
+    """
+    Kolonlar INDEX_VERSION başına bir kez kurulur, rapor metni eşik başına cache'lenir;
+    ikisi de thread'de hesaplanır (1M üyede yeni eşik raporu bile loop'u ~0.2s tutardı).
+    """
+    global TIERS_CACHE
+    version = INDEX_VERSION
+    entry = TIERS_CACHE if TIERS_CACHE is not None and TIERS_CACHE[0] == version else None
+    if entry is not None:
+        text = entry[2].get(near_tl)
+        if text is not None:
+            metric_inc("tiers_total", result="cached")
+            return text
+        metric_inc("tiers_total", result="report")
+        _, text = await asyncio.to_thread(_tiers_build_and_report_sync, None, entry[1], near_tl)
+    else:
+        members = list(USER_INDEX.values())
+        with timed("tiers_build_seconds"):
+            cols, text = await asyncio.to_thread(_tiers_build_and_report_sync, members, None, near_tl)
+        entry = (version, cols, {})
+        if INDEX_VERSION == version:
+            TIERS_CACHE = entry
+        metric_inc("tiers_total", result="build")
+    reports = entry[2]
+    if len(reports) >= 32:
+        reports.clear()
+    reports[near_tl] = text
+    return text
+
+
+async def warm_tiers_cache() -> None:
+    if not TIERS_WARM or not USER_INDEX or INDEX_PARTIAL:
+        return
+    try:
+        await tiers_report(TIERS_NEAR_TL)
+    except Exception as e:
+        print("[TIERS] warm hatası:", repr(e))
+
+
+def _text_pages(text: str) -> list[str]:
+    """
+    Telegram mesaj sınırı için satır sınırlarından böler; sınırı tek başına aşan satır kesilir.
+    """
+    pages: list[str] = []
+    cur = ""
+    for line in text.split("\n"):
+        while len(line) > TG_MESSAGE_LIMIT:
+            if cur:
+                pages.append(cur)
+                cur = ""
+            pages.append(line[:TG_MESSAGE_LIMIT])
+            line = line[TG_MESSAGE_LIMIT:]
+        if cur and len(cur) + len(line) + 1 > TG_MESSAGE_LIMIT:
+            pages.append(cur)
+            cur = ""
+        cur = f"{cur}\n{line}" if cur else line
+    if cur:
+        pages.append(cur)
+    return pages
+
+
+async def tiers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_admin(update):
+        await update.message.reply_text("⛔ Yetkin yok.")
+        return
+    if not USER_INDEX or INDEX_PARTIAL:
+        await update.message.reply_text("⚠️ İndeks henüz hazır değil.")
+        return
+
+    near_tl = TIERS_NEAR_TL
+    if context.args:
+        arg = context.args[0].lower().replace(".", "").replace(",", "").removesuffix("tl")
+        if not arg.isdigit():
+            await update.message.reply_text("Kullanım: /tiers [kalan TL eşiği, örn. 25000]")
+            return
+        near_tl = int(arg)
+
+    # çok seviyeli/uzun etiketli raporlar 4096 karakteri aşabiliyor
+    for page in _text_pages(await tiers_report(near_tl)):
+        await update.message.reply_text(page)
+
+
+# ----------------------
+# /stats (admin)
+# ----------------------
+def _counter(name: str, **labels) -> float:
+    return METRIC_COUNTERS.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def _hist_line(title: str, name: str, **labels) -> str | None:
+    h = METRIC_HISTS.get((name, tuple(sorted(labels.items()))))
+    if not h:
+        return None
+    n = int(sum(h[:-1]))
+    p50 = hist_quantile(name, 0.5, **labels) or 0
+    p95 = hist_quantile(name, 0.95, **labels) or 0
+    return f"{title}: p50 {p50 * 1000:.0f}ms · p95 {p95 * 1000:.0f}ms · n={n}"
+
+
+def build_stats_text() -> str:
+    g = _gauges()
+    hit = _counter("betco_cache_total", result="hit")
+    miss = _counter("betco_cache_total", result="miss")
+    coal = _counter("betco_cache_total", result="coalesced")
+    stale = _counter("betco_cache_total", result="stale")
+    total = hit + miss + coal + stale
+    lines = [
+        "📊 Bot istatistikleri",
+        f"Uptime: {g['uptime_seconds'] / 3600:.1f} saat",
+        f"İndeks: {g['user_index_size']} üye, yaş {g['user_index_age_seconds']:.0f}s",
+        "İndeks arama: "
+        f"birebir {_counter('user_index_lookup_total', result='exact'):.0f} · "
+        f"normalize {_counter('user_index_lookup_total', result='normalized'):.0f} · "
+        f"yok {_counter('user_index_lookup_total', result='miss'):.0f}",
+        "Panel tekil sorgu: "
+        f"bulunan {_counter('panel_point_lookup_total', result='found'):.0f} · "
+        f"yok {_counter('panel_point_lookup_total', result='miss'):.0f} · "
+        f"negatif cache {_counter('panel_point_lookup_total', result='negative_cache'):.0f} · "
+        f"hata {_counter('panel_point_lookup_total', result='error'):.0f}",
+        f"Betco cache: {g['betco_cache_size']} kayıt, hit %{(hit / total * 100) if total else 0:.0f} "
+        f"(hit {hit:.0f} · miss {miss:.0f} · birleşen {coal:.0f} · eski {stale:.0f} · "
+        f"yedek {_counter('betco_cache_total', result='fallback'):.0f})",
+        f"Betco prefetch: sıcak {g['betco_hot_logins']} login · "
+        f"tazelenen {_counter('betco_prefetch_total', result='ok'):.0f} · "
+        f"hata {_counter('betco_prefetch_total', result='fail'):.0f}",
+        f"Zamanlayıcı: kuyruk {g['sched_queue_depth']} ({g['sched_queued_chats']} chat) · "
+        f"çalışan {g['sched_running']} · "
+        f"birleşen {sum(_counter('sched_jobs_total', upstream=u, result='dedup') for u in SCHED_UPSTREAM_CONCURRENCY):.0f}",
+        f"Auth varyant: hit={AUTH_STATS['hit']} fallback={AUTH_STATS['fallback']} "
+        f"discover={AUTH_STATS['discover']} fail={AUTH_STATS['fail']}",
+        f"Breaker: betco {BETCO_BREAKER.state} · panel {PANEL_BREAKER.state} · "
+        f"reddedilen {_counter('breaker_rejected_total', upstream='betco') + _counter('breaker_rejected_total', upstream='panel'):.0f} · "
+        f"Betco hız limiti {f'{BETCO_LIMITER.rate:.1f}/s' if BETCO_LIMITER.rate else 'yok'}",
+        "",
+        "/ka aşamaları:",
+    ]
+    for stage in ("index", "point_lookup", "first_reply", "time_to_first_reply", "member_detail", "betco", "edit", "total"):
+        line = _hist_line(f"  {stage}", "ka_stage_seconds", stage=stage)
+        if line:
+            lines.append(line)
+    for upstream in SCHED_UPSTREAM_CONCURRENCY:
+        line = _hist_line(f"  kuyruk bekleme ({upstream})", "sched_wait_seconds", upstream=upstream)
+        if line:
+            lines.append(line)
+
+    lines.append("")
+    lines.append("Betco HTTP:")
+    for (name, labels), _ in sorted(METRIC_HISTS.items()):
+        if name == "betco_http_seconds":
+            d = dict(labels)
+            lines.append(_hist_line(f"  {d.get('method')} {d.get('path')}", name, **d))
+
+    for mode in ("full", "delta"):
+        line = _hist_line(f"İndeks refresh ({mode})", "index_refresh_seconds", mode=mode)
+        if line:
+            lines.append(line)
+    line = _hist_line("Config refresh", "config_refresh_seconds")
+    if line:
+        lines.append(line)
+    return "\n".join(lines)
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not is_admin(update):
+        await update.message.reply_text("⛔ Yetkin yok.")
+        return
+    await update.message.reply_text(build_stats_text())
+
+
+METRICS_SERVER: asyncio.AbstractServer | None = None
+
+
+async def _on_startup(app: Application) -> None:
+    global METRICS_SERVER, SNAPSHOT_TASK
+    METRICS_SERVER = await start_metrics_server()
+    if not USER_INDEX and INDEX_SNAPSHOT_PATH and os.path.exists(INDEX_SNAPSHOT_PATH):
+        # restart sonrası polling beklemesin: snapshot thread'de yüklenir, stale olarak servis edilir
+        SNAPSHOT_TASK = asyncio.create_task(load_index_snapshot_async())
+    if USER_INDEX and not NAME_INDEX:
+        async with INDEX_LOCK:
+            await rebuild_name_index()
+
+
+async def _on_shutdown(app: Application) -> None:
+    if METRICS_SERVER is not None:
+        METRICS_SERVER.close()
+    await close_panel_client()
+    await close_betco_client()
+
+
+def build_application(concurrent_updates: int | None = None, request=None) -> Application:
+    """
+    Handler'ları kayıtlı Application. concurrent_updates <= 1 ise update'ler sırayla işlenir.
+    request: test/bench için sahte Telegram API (telegram.request.BaseRequest).
+    """
+    limit = TG_CONCURRENT_UPDATES if concurrent_updates is None else concurrent_updates
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(limit if limit > 1 else False)
+        .post_init(_on_startup)
+        .post_shutdown(_on_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
     app.add_handler(CommandHandler("chatid", chatid))  # en üstte dursun
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("selftest", selftest))
     app.add_handler(CommandHandler("ka", ka))
+    app.add_handler(CommandHandler("kaa", kaa))
+    app.add_handler(CommandHandler("export", export))
+    app.add_handler(CommandHandler("stats", stats))
+    app.add_handler(CommandHandler("tiers", tiers))
+    return app
+
+
+def main() -> None:
+    load_client_ids()
+
+    app = build_application()
 
     # job_queue opsiyonel
     if app.job_queue:
         async def refresh_index_job(context: ContextTypes.DEFAULT_TYPE) -> None:
             await refresh_index(force=True)
+            await warm_tiers_cache()
 
         async def refresh_cfg_job(context: ContextTypes.DEFAULT_TYPE) -> None:
             await refresh_panel_config(force=True)
@@ -1041,11 +3827,23 @@ def main() -> None:
         app.job_queue.run_once(refresh_index_job, when=1)
         app.job_queue.run_repeating(refresh_index_job, interval=INDEX_TTL_SECONDS, first=INDEX_TTL_SECONDS)
 
+        if CLIENT_ID_PREFETCH:
+            async def prefetch_client_ids_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+                await prefetch_client_ids()
+
+            app.job_queue.run_repeating(prefetch_client_ids_job, interval=CLIENT_ID_PREFETCH_INTERVAL, first=60)
+
+        if BETCO_PREFETCH:
+            async def prefetch_hot_betco_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+                await prefetch_hot_betco()
+
+            app.job_queue.run_repeating(prefetch_hot_betco_job, interval=BETCO_PREFETCH_INTERVAL, first=BETCO_PREFETCH_INTERVAL)
+
         if PANEL_CONFIG_URL:
             app.job_queue.run_once(refresh_cfg_job, when=2)
             app.job_queue.run_repeating(refresh_cfg_job, interval=CONFIG_TTL_SECONDS, first=CONFIG_TTL_SECONDS)
 
-    print("Bot başladı. Telegram’dan /start yaz.")
+    print(f"Bot başladı (eşzamanlı update: {TG_CONCURRENT_UPDATES}). Telegram’dan /start yaz.")
     app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 